@@ -10,6 +10,8 @@ from wagtail.snippets.edit_handlers import SnippetChooserPanel
 from wagtail.snippets.models import register_snippet
 from wagtail_localize.synctree import Page as LocalizePage
 
+from menu.page_urls import get_page_urls
+
 
 class ImageBlock(blocks.StructBlock):
     image = ImageChooserBlock()
@@ -80,7 +82,12 @@ class BlogIndexPage(LocalizePage):
     def get_context(self, request, *args, **kwargs):
         """Adds custom fields to the context"""
         context = super().get_context(request, *args, **kwargs)
-        context['posts'] = BlogPostPage.objects.child_of(self).live().public().reverse()
+        posts = list(BlogPostPage.objects.child_of(self).live().public().reverse())
+        # resolve all the post urls together rather than post.url for each one in the template
+        post_urls = get_page_urls(posts, request)
+        for post in posts:
+            post.listing_url = post_urls[post.id]
+        context['posts'] = posts
         context['lang_versions'] = self.get_translations()
         context['default_lang'] = (settings.LANGUAGES[0][0])
         return context
\ No newline at end of file
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MenuConfig(AppConfig):
     name = 'menu'
+
+    def ready(self):
+        # connect the cache invalidation handlers
+        from . import signals  # noqa
+        # warn when the cache the invalidation relies on isn't shared between workers
+        from . import checks  # noqa
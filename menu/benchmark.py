@@ -0,0 +1,49 @@
+import math
+import statistics
+import time
+
+from django.db import connection
+
+# Timing helpers for the bench_* management commands.
+
+
+def measure(call):
+    # (seconds, queries) for one call
+    # queries are counted rather than captured, the debug query log is capped at 9000 entries
+    queries = [0]
+    def count_query(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_query):
+        started = time.perf_counter()
+        call()
+        duration = time.perf_counter() - started
+    return duration, queries[0]
+
+
+def summarize(runs):
+    # latency percentiles in ms and query counts over the runs
+    durations = sorted(duration * 1000 for duration, queries in runs)
+    queries = [queries for duration, queries in runs]
+
+    def percentile(p):
+        # nearest rank
+        return round(durations[max(math.ceil(p * len(durations) / 100) - 1, 0)], 3)
+
+    return {
+        'runs': len(runs),
+        'ms': {
+            'min': round(durations[0], 3),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': round(durations[-1], 3),
+            'mean': round(statistics.mean(durations), 3),
+        },
+        'queries': {
+            'min': min(queries),
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        },
+    }
@@ -0,0 +1,162 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .localization import request_memo
+
+# Compiled menus are stored in the default cache, one entry per menu/locale/authentication state.
+# The entry is the sorted list of item dictionaries get_menu_items returns, an empty list is
+# stored for menus with nothing to show so that those aren't rebuilt on every request either.
+MENU_CACHE_TIMEOUT = getattr(settings, 'MENU_CACHE_TIMEOUT', 60 * 60 * 24)
+MENU_CACHE_PREFIX = 'menu-items'
+MENU_FRAGMENT_PREFIX = 'menu-fragment'
+
+# Every menu cache key includes the menu generation, a counter kept in the shared cache.
+# Invalidating all menus is a single increment (see signals.py) that every worker sees on its
+# next lookup, entries from older generations are never read again and age out of the cache.
+# The generation starts from the clock rather than 0 so that if the counter itself is lost from
+# the cache it can't come back at a value already used for other entries.
+MENU_GENERATION_KEY = 'menu-generation'
+
+# Inside a request (localization_memo(), see LocalizationMemoMiddleware) the generation and the
+# registry versions are read from the shared cache once, all in one round trip, and reused until
+# the request ends. A bump made in the request is seen straight away.
+VERSIONS_MEMO_KEY = 'shared-versions'
+# keys of every VersionedRegistry, read together with the generation
+_version_keys = [MENU_GENERATION_KEY]
+
+
+def _request_versions():
+    # {key: version} read for this request, None outside of a request
+    memo = request_memo()
+    if memo is None:
+        return None
+    if VERSIONS_MEMO_KEY not in memo:
+        memo[VERSIONS_MEMO_KEY] = cache.get_many(_version_keys)
+    return memo[VERSIONS_MEMO_KEY]
+
+
+def get_shared_version(key):
+    # the version kept in the shared cache under key, started from the clock if it isn't there
+    versions = _request_versions()
+    if versions is not None and key in versions:
+        return versions[key]
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    if versions is not None:
+        versions[key] = version
+    return version
+
+
+def forget_shared_version(key):
+    # after a bump, the next read in this request goes back to the shared cache
+    versions = _request_versions()
+    if versions is not None:
+        versions.pop(key, None)
+
+
+def get_menu_generation():
+    return get_shared_version(MENU_GENERATION_KEY)
+
+
+def bump_menu_generation():
+    # retire every cached menu, compiled items, rendered html and api responses alike
+    try:
+        cache.incr(MENU_GENERATION_KEY)
+    except ValueError:
+        # counter not in the cache (never set or evicted) - restart it from the clock
+        cache.set(MENU_GENERATION_KEY, int(time.time() * 1000), None)
+    forget_shared_version(MENU_GENERATION_KEY)
+
+
+def menu_cache_key(menu_id, language_code, authenticated, generation):
+    return f'{MENU_CACHE_PREFIX}:{generation}:{menu_id}:{language_code}:{int(bool(authenticated))}'
+
+
+def get_compiled_menus(menu_ids, language_code, authenticated, build, generation=None):
+    # bulk version of get_compiled_menu - one cache round trip for all the menus
+    # misses are compiled together with build(menu_ids, authenticated) -> {menu id: items}
+    # pass the generation in when making several lookups for the same page
+    if generation is None:
+        generation = get_menu_generation()
+    keys = {
+        menu_id: menu_cache_key(menu_id, language_code, authenticated, generation) for menu_id in menu_ids
+    }
+    cached = cache.get_many(keys.values())
+    compiled = {menu_id: cached[key] for menu_id, key in keys.items() if key in cached}
+    missing = [menu_id for menu_id in keys if menu_id not in compiled]
+    if missing:
+        built = build(missing, authenticated)
+        set_compiled_menus(built, language_code, authenticated, generation)
+        compiled.update(built)
+    return compiled
+
+
+def set_compiled_menus(compiled, language_code, authenticated, generation=None):
+    # store freshly compiled menus ({menu id: items}), replacing anything cached
+    if generation is None:
+        generation = get_menu_generation()
+    cache.set_many(
+        {
+            menu_cache_key(menu_id, language_code, authenticated, generation): items
+            for menu_id, items in compiled.items()
+        },
+        MENU_CACHE_TIMEOUT
+    )
+
+
+def get_compiled_menu(menu, language_code, authenticated, build):
+    # return the compiled item list for the menu, calling build([menu.id], authenticated) on a miss
+    return get_compiled_menus([menu.id], language_code, authenticated, build)[menu.id]
+
+
+def menu_version(menu_id, language_code, authenticated, *variant):
+    # digest identifying what a menu looks like in the current generation
+    # variant: anything else the output depends on (template name, depth)
+    return hashlib.md5(repr((
+        get_menu_generation(), menu_id, language_code, bool(authenticated), variant
+    )).encode()).hexdigest()
+
+
+def menu_fragment_key(menu_id, language_code, authenticated, *variant):
+    return f'{MENU_FRAGMENT_PREFIX}:{menu_version(menu_id, language_code, authenticated, *variant)}'
+
+
+class VersionedRegistry:
+    """ Data loaded once per process and reloaded when any process changes it
+        key:    cache key of the version, shared by every process
+        loader: function returning the data
+        get() returns the data, loaded again first if the version in the shared cache has moved on
+        since it was loaded (the version is read once per request). bump() moves every process on to
+        a new version, call it on commit after the data changes.
+        Versions come from the clock, so a version lost from the cache is never reused, and
+        (version, data) is replaced as a whole so threads never see a version with the wrong data.
+        The data is shared between requests, treat it as read only. """
+
+    def __init__(self, key, loader):
+        self.key = key
+        self.loader = loader
+        self._loaded = (None, None)
+        if key not in _version_keys:
+            _version_keys.append(key)
+
+    def version(self):
+        # checked once per request, see get_shared_version
+        return get_shared_version(self.key)
+
+    def bump(self):
+        cache.set(self.key, int(time.time() * 1000), None)
+        forget_shared_version(self.key)
+
+    def get(self):
+        version = self.version()
+        loaded_version, data = self._loaded
+        if loaded_version != version:
+            data = self.loader()
+            self._loaded = (version, data)
+        return data
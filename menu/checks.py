@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+# cache backends that keep their entries in the process (or don't keep them at all)
+PROCESS_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    # cached menus, hreflang alternates and the locale/flag/url path/logo registries are invalidated
+    # through versions kept in the default cache (the redirect maps in MENU_HREFLANG_CACHE) - with a
+    # per process cache a change saved in one worker is never seen by the others
+    aliases = ['default', getattr(settings, 'MENU_HREFLANG_CACHE', 'default')]
+    warnings = []
+    for alias in dict.fromkeys(aliases):
+        if alias not in settings.CACHES:
+            warnings.append(Error(
+                f"MENU_HREFLANG_CACHE is '{alias}', there is no such cache in CACHES.",
+                obj='menu',
+                id='menu.E001',
+            ))
+            continue
+        backend = settings.CACHES[alias].get('BACKEND', '')
+        if backend in PROCESS_CACHE_BACKENDS:
+            warnings.append(Warning(
+                f"The {alias} cache ({backend}) is not shared between processes.",
+                hint="Menu and language switcher changes saved in one worker won't reach the others. "
+                     "Configure a shared cache such as DatabaseCache, redis or memcached in CACHES.",
+                obj='menu',
+                id='menu.W001',
+            ))
+    return warnings
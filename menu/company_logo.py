@@ -0,0 +1,60 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from wagtail.images.models import SourceImageIOError
+
+from .cache import VersionedRegistry
+from .models import CompanyLogo
+
+logger = logging.getLogger(__name__)
+
+# The company logo snippet and the renditions the templates use, kept in the shared cache and in
+# process memory. Saving or deleting the snippet or its image rebuilds it (menu.signals), generating
+# the renditions then rather than on the first page view. The version in the shared cache tells each
+# process when its copy is out of date.
+# The renditions are on the logo as logo.renditions (by filter spec) and logo.rendition (the first filter,
+# the one menus/main_menu.html shows in the navbar).
+COMPANY_LOGO_FILTERS = getattr(settings, 'COMPANY_LOGO_FILTERS', ['height-40'])
+COMPANY_LOGO_KEY = 'company-logo'
+COMPANY_LOGO_VERSION_KEY = 'company-logo-version'
+
+
+def load_company_logo():
+    # the first CompanyLogo with its renditions generated, None if there isn't one
+    # a rendition that can't be generated (source file missing) is left out, as the image tag would
+    logo = CompanyLogo.objects.select_related('logo').first()
+    if logo is not None:
+        logo.renditions = {}
+        for filter_spec in COMPANY_LOGO_FILTERS:
+            try:
+                logo.renditions[filter_spec] = logo.logo.get_rendition(filter_spec)
+            except SourceImageIOError:
+                logger.warning("Company logo rendition %s of image %s could not be generated", filter_spec, logo.logo_id)
+        logo.rendition = logo.renditions.get(COMPANY_LOGO_FILTERS[0]) if COMPANY_LOGO_FILTERS else None
+    return logo
+
+
+def load_shared_company_logo():
+    # the logo another process built, or built here if the shared cache doesn't have it
+    shared = cache.get(COMPANY_LOGO_KEY)
+    if shared is None:
+        shared = {'logo': load_company_logo()}
+        cache.set(COMPANY_LOGO_KEY, shared, None)
+    return shared['logo']
+
+
+company_logo_registry = VersionedRegistry(COMPANY_LOGO_VERSION_KEY, load_shared_company_logo)
+
+
+def refresh_company_logo():
+    # rebuild the logo and its renditions, store it in the shared cache and move every process on to it
+    logo = load_company_logo()
+    cache.set(COMPANY_LOGO_KEY, {'logo': logo}, None)
+    company_logo_registry.bump()
+    return logo
+
+
+def get_company_logo():
+    # the logo from process memory, or from the shared cache if it has been rebuilt since
+    return company_logo_registry.get()
@@ -1,11 +1,14 @@
-from django.forms.widgets import Select
-from wagtail_localize.synctree import Locale
+from django import forms
+from django.forms.formsets import DELETION_FIELD_NAME, ORDERING_FIELD_NAME
 from django.utils.html import format_html
 from wagtail.admin.edit_handlers import (
     EditHandler,
     FieldPanel,
+    InlinePanel,
 )
 
+from .widgets import SubMenuChooser
+
 class ReadOnlyPanel(EditHandler):
     """ ReadOnlyPanel EditHandler Class - built from ideas on https://github.com/wagtail/wagtail/issues/2893
         Most credit to @BertrandBordage for this.
@@ -196,20 +199,69 @@ class RichHelpPanel(EditHandler):
             '</div>',
             format_html(self.get_style()), self.label(), self.render())  
 
+class CachedInlinePanel(InlinePanel):
+    """ CachedInlinePanel EditHandler Class - InlinePanel that builds its child edit handler once
+        InlinePanel builds and binds a new child edit handler (the panels of one inline form) to the
+        model for every inline form on every request. This one binds it to the model once per process
+        and clones that for each inline form.
+        Each inline form also gets the parent form as form.parent_form, so child panels can read the
+        parent object (and keep state for the request) without parsing the url.
+        Usage as InlinePanel.
+        """
+    # (model, relation name, heading, panel definitions) -> child edit handler bound to the related model
+    # panels compare by identity, two declarations of the same relation with their own panels get
+    # their own handlers; None (panels from the related model) is the same for every declaration
+    child_edit_handlers = {}
+
+    def get_child_edit_handler(self):
+        panels = tuple(self.panels) if self.panels is not None else None
+        key = (self.model, self.relation_name, self.heading, panels)
+        if key not in self.child_edit_handlers:
+            self.child_edit_handlers[key] = super().get_child_edit_handler()
+        return self.child_edit_handlers[key]
+
+    # as InlinePanel.on_form_bound, with parent_form set on each inline form before it is bound
+    def on_form_bound(self):
+        self.formset = self.form.formsets[self.relation_name]
+        child_edit_handler = self.get_child_edit_handler()
+
+        self.children = []
+        for subform in self.formset.forms:
+            # override the DELETE and ORDER fields to have a hidden input
+            subform.fields[DELETION_FIELD_NAME].widget = forms.HiddenInput()
+            if self.formset.can_order:
+                subform.fields[ORDERING_FIELD_NAME].widget = forms.HiddenInput()
+            subform.parent_form = self.form
+            self.children.append(child_edit_handler.bind_to(
+                instance=subform.instance, request=self.request, form=subform))
+
+        # if this formset is valid, it may have been re-ordered; respect that
+        # in case the parent form errored and we need to re-render
+        if self.formset.can_order and self.formset.is_valid():
+            self.children.sort(
+                key=lambda child: child.form.cleaned_data[ORDERING_FIELD_NAME] or 1)
+
+        empty_form = self.formset.empty_form
+        empty_form.fields[DELETION_FIELD_NAME].widget = forms.HiddenInput()
+        if self.formset.can_order:
+            empty_form.fields[ORDERING_FIELD_NAME].widget = forms.HiddenInput()
+        empty_form.parent_form = self.form
+        self.empty_child = child_edit_handler.bind_to(
+            instance=empty_form.instance, request=self.request, form=empty_form)
+
 class SubMenuFieldPanel(FieldPanel):
     # Usage: field_name - database field to bind to
-    #        list_queryset - queryset to parse for the dropdown options
-    #                      - amend _get_choice_list() to filter and return list of value/display tuples
+    #        list_queryset - queryset of the menus that can be chosen
     #        DO NOT add choices to field definition or pass a widget to this panel
+    #        Must be in a CachedInlinePanel, the parent (Menu) form is read from form.parent_form
     #
-    # Customised FieldPanel to allow dynamic drop down content based on the parent properties.
+    # Customised FieldPanel to choose a menu with a search box based on the parent properties.
     # Very specific to the SubMenu orderble but could be reworked for a more generic needs.
-    # To repurpose, pass the desired queryset to the list_queryset argument, amend _get_choice_list
+    # The chooser (menu.widgets.SubMenuChooser) fetches the matching menus a page at a time from the
+    # submenu_chooser admin endpoint, so the form only holds the chosen menu's title
     #
     # Filters menu choices based on locale and excludes the current menu from the list
-    # Needs revisiting - couldn't find any way to access parent class (Menu) properties from here
-    # in the end, used uri which has parent id (if it has been saved) or locale if it's a new menu
-    # if it has been saved, locale can be derived from the parent id
+    # The parent menu's id (None for a new menu) and locale come from the parent form's instance
     #
     # Make sure field model does not declare choices - this makes the choices static
     # Queryset must be passed in as it is the Menu object set. Importing in this module 
@@ -228,36 +280,51 @@ class SubMenuFieldPanel(FieldPanel):
             'field_name': self.field_name,
         }
 
-    # Get parent id (if any) and locale id - logic based on uri of form
-    # uri ends with parent id if it is in edit mode, ends in add/?locale=code if it is in add new mode
-    # Fudge to get around lack of access to parent object
-    # Must be called after request is bound
-    # Called from form_bound event via _get_choice_list() here
-    def _get_locale_and_parent(self):
-        path = self.request.get_raw_uri()
-        if path.split('/')[-2] == 'add':
-            locale_id = Locale.objects.get(language_code=path.split('/')[-1].replace('?locale=','')).pk
-            parent_menu_id = None
-        else:
-            parent_menu = self.list_queryset.get(id=int(path.split('/')[-2]))
-            parent_menu_id = getattr(parent_menu, 'id')  
-            locale_id = getattr(parent_menu, 'locale_id')  
-        return parent_menu_id, locale_id
-
-    # Create a list from the full queryset filtered by locale, exclude parent
-    def _get_choice_list(self):
-        parent_menu_id, locale_id = self._get_locale_and_parent()
-        menu_list = self.list_queryset
-        if locale_id:
-            menu_list = menu_list.filter(locale_id=locale_id)
-        if parent_menu_id:
-            menu_list = menu_list.exclude(id=parent_menu_id)
-        return [('', '------')] + list(menu_list.values_list('id','title'))
-
-    # declare widget with choices (this event seems to get called twice)
-    # change field type to typed_choice_field otherwise it'll appear as a text field with
-    # dropdown behaviour
+    # Titles of the menus the parent already has as submenus, to show in the choosers
+    # one query, the submenus are joined through the parent's submenu items
+    def _get_title_list(self, parent_menu_id):
+        if not parent_menu_id:
+            return {}
+        return dict(
+            self.list_queryset.filter(id=parent_menu_id, sub_menu_items__submenu__isnull=False)
+            .values_list('sub_menu_items__submenu_id', 'sub_menu_items__submenu__title')
+        )
+
+    # The parent/locale and titles are the same for every inline form on the page, look them up
+    # once and keep them on the parent form (on_form_bound runs for each SubMenuItem form, twice)
+    def _get_parent_chooser(self):
+        parent_form = self.form.parent_form
+        choosers = getattr(parent_form, '_submenu_choosers', None)
+        if choosers is None:
+            choosers = parent_form._submenu_choosers = {}
+        if self.field_name not in choosers:
+            parent_menu = parent_form.instance
+            choosers[self.field_name] = (
+                parent_menu.pk, parent_menu.locale_id, self._get_title_list(parent_menu.pk)
+            )
+        return choosers[self.field_name]
+
+    # Title of the chosen menu - from the parent's submenus, or looked up if it was just chosen
+    def _get_title(self, titles, menu_id):
+        try:
+            menu_id = int(menu_id)
+        except (TypeError, ValueError):
+            return ''
+        if menu_id not in titles:
+            titles[menu_id] = self.list_queryset.filter(id=menu_id).values_list('title', flat=True).first() or ''
+        return titles[menu_id]
+
+    # the chooser as the widget of the form class, so the formset's forms and the page's form media
+    # (taken from the first form, or the empty form if there are none) include its js and css
+    def widget_overrides(self):
+        return {self.field_name: SubMenuChooser()}
+
+    # set up the chooser widget for this form (this event seems to get called twice)
     def on_form_bound(self):
-        self.form.fields[self.field_name].widget = Select(choices=self._get_choice_list())
-        self.form.fields[self.field_name].__class__.__name__ = 'typed_choice_field'
+        parent_menu_id, locale_id, titles = self._get_parent_chooser()
+        self.form.fields[self.field_name].widget = SubMenuChooser(
+            locale_id=locale_id,
+            exclude_id=parent_menu_id,
+            title=self._get_title(titles, self.form[self.field_name].value()),
+        )
         super().on_form_bound()
@@ -0,0 +1,46 @@
+import logging
+
+from django.conf import settings
+from wagtail.images import get_image_model
+from wagtail.images.models import SourceImageIOError
+
+from .cache import VersionedRegistry
+
+# Flag images for the language switcher, uploaded to wagtail with the title flag-<language code>
+# (eg flag-fr, flag-en), all of them with their renditions as {language code: rendition}.
+# A VersionedRegistry, bumped when an image is saved or deleted (menu.signals).
+FLAG_TITLE_PREFIX = 'flag-'
+LANGUAGE_FLAG_FILTER = getattr(settings, 'LANGUAGE_FLAG_FILTER', 'fill-16x11')
+FLAG_REGISTRY_VERSION_KEY = 'flag-registry-version'
+
+logger = logging.getLogger(__name__)
+
+
+def load_flags():
+    # {language code: rendition} for every flag image, rendered with LANGUAGE_FLAG_FILTER
+    # where more than one image has the same title, the first uploaded is used
+    # a flag whose rendition can't be generated (source file missing) is left out, the language
+    # switcher shows that language without a flag
+    images = {}
+    for image in get_image_model().objects.filter(title__startswith=FLAG_TITLE_PREFIX).order_by('-id'):
+        images[image.title[len(FLAG_TITLE_PREFIX):]] = image
+    flags = {}
+    for language_code, image in images.items():
+        try:
+            flags[language_code] = image.get_rendition(LANGUAGE_FLAG_FILTER)
+        except SourceImageIOError:
+            logger.warning("Flag rendition %s of image %s could not be generated", LANGUAGE_FLAG_FILTER, image.id)
+    return flags
+
+
+flag_registry = VersionedRegistry(FLAG_REGISTRY_VERSION_KEY, load_flags)
+
+
+def get_flags():
+    # the registry, reloaded if a flag image has changed since it was loaded
+    return flag_registry.get()
+
+
+def get_flag(language_code):
+    # the flag rendition for the language code, None if there is no flag image
+    return get_flags().get(language_code)
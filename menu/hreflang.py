@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import translation
+from wagtail_localize.synctree import Page
+
+from .locales import get_default_locale, get_locales
+from .models import HreflangAlternate
+from .page_urls import get_page_urls
+
+# The alternate links of every page, materialized in HreflangAlternate by translation_key.
+# A group (all the rows of one translation_key) is rewritten whenever one of its pages is published,
+# unpublished, moved or created (menu.signals). Moving a page, or publishing it with a new slug,
+# changes the urls of everything below it, so the groups of its descendants are rewritten as well.
+# Groups that have never been written are filled in on first read, manage.py rebuild_hreflang
+# writes them all. A group with no rows (none of its pages has a url) leaves a marker in the shared
+# cache so that reads don't rewrite it again and again, only the signals and rebuild_hreflang do.
+# The language switch redirect map, {language code: url} for every locale with the fallback to the
+# default language already applied, is kept in the shared cache by translation_key and rewritten
+# along with each group.
+# The markers and the maps are kept in the MENU_HREFLANG_CACHE cache (the default cache unless set),
+# one entry each per translation key.
+MENU_HREFLANG_CACHE = getattr(settings, 'MENU_HREFLANG_CACHE', 'default')
+TRANSLATION_URLS_PREFIX = 'translation-urls'
+EMPTY_ALTERNATES_PREFIX = 'hreflang-empty'
+
+
+def hreflang_cache():
+    return caches[MENU_HREFLANG_CACHE]
+
+
+def translation_urls_key(translation_key):
+    return f'{TRANSLATION_URLS_PREFIX}:{translation_key}'
+
+
+def empty_alternates_key(translation_key):
+    return f'{EMPTY_ALTERNATES_PREFIX}:{translation_key}'
+
+
+def translation_urls(rows):
+    # {language code: url} for every locale from the rows of one group - the translation if it is live,
+    # otherwise the page in the default language, otherwise the home page ('/')
+    alternates = {row.hreflang: row.url for row in rows}
+    fallback = alternates.get('x-default', '/')
+    return {
+        locale.language_code: alternates.get(locale.language_code, fallback) for locale in get_locales()
+    }
+
+
+def refresh_alternates(translation_keys):
+    # rewrite the groups for translation_keys from the live pages, returns the rows by translation key
+    # urls are computed without an active language so they don't depend on the request or admin user
+    translation_keys = set(translation_keys)
+    if not translation_keys:
+        return {}
+    default_locale_id = get_default_locale().id
+    languages = {locale.id: locale.language_code for locale in get_locales()}
+    pages = list(Page.objects.live().filter(translation_key__in=translation_keys).order_by('id'))
+    with translation.override(None):
+        urls = get_page_urls(pages)
+        full_urls = get_page_urls(pages, full=True)
+
+    groups = {translation_key: [] for translation_key in translation_keys}
+    for page in pages:
+        if not urls[page.id] or page.locale_id not in languages:
+            continue
+        hreflangs = [languages[page.locale_id]]
+        if page.locale_id == default_locale_id:
+            hreflangs.append('x-default')
+        for hreflang in hreflangs:
+            groups[page.translation_key].append(HreflangAlternate(
+                translation_key=page.translation_key, hreflang=hreflang, page=page,
+                url=urls[page.id], full_url=full_urls[page.id],
+            ))
+
+    # a request filling in the same group at the same time writes the same rows
+    with transaction.atomic():
+        HreflangAlternate.objects.filter(translation_key__in=translation_keys).delete()
+        HreflangAlternate.objects.bulk_create(
+            [row for rows in groups.values() for row in rows], ignore_conflicts=True
+        )
+    cache = hreflang_cache()
+    cache.set_many({
+        translation_urls_key(translation_key): translation_urls(rows) for translation_key, rows in groups.items()
+    }, None)
+    # mark the empty groups as written, unmark the others
+    cache.set_many({
+        empty_alternates_key(translation_key): True for translation_key, rows in groups.items() if not rows
+    }, None)
+    cache.delete_many([empty_alternates_key(translation_key) for translation_key, rows in groups.items() if rows])
+    return groups
+
+
+def fill_missing_alternates(translation_keys):
+    # write the groups of translation keys that have no rows, unless they were written empty
+    # returns the rows by translation key of the groups written
+    translation_keys = set(translation_keys)
+    empty = hreflang_cache().get_many([empty_alternates_key(translation_key) for translation_key in translation_keys])
+    return refresh_alternates(
+        translation_key for translation_key in translation_keys if empty_alternates_key(translation_key) not in empty
+    )
+
+
+def refresh_descendant_alternates(page):
+    # rewrite the groups of the page and every page below it
+    refresh_alternates(
+        Page.objects.descendant_of(page, inclusive=True).values_list('translation_key', flat=True)
+    )
+
+
+def refresh_page_alternates(page):
+    # rewrite the group of the page, and the groups below any page in it whose url has changed
+    before = dict(
+        HreflangAlternate.objects.filter(translation_key=page.translation_key)
+        .exclude(hreflang='x-default').values_list('page_id', 'url')
+    )
+    rows = refresh_alternates([page.translation_key])[page.translation_key]
+    for row in rows:
+        if row.hreflang != 'x-default' and row.page_id in before and before[row.page_id] != row.url:
+            refresh_descendant_alternates(row.page)
+
+
+def get_alternates(translation_key):
+    # {hreflang: HreflangAlternate} for the translation key, the group is written if it never has been
+    rows = list(HreflangAlternate.objects.filter(translation_key=translation_key))
+    if not rows:
+        rows = fill_missing_alternates([translation_key]).get(translation_key, [])
+    return {row.hreflang: row for row in rows}
+
+
+def get_translation_url(translation_key, language_code):
+    # the url to switch to language_code from a page with the translation key, from the redirect map
+    # a map cached before the locale was added is rebuilt
+    cache = hreflang_cache()
+    urls = cache.get(translation_urls_key(translation_key))
+    if urls is None or language_code not in urls:
+        urls = translation_urls(get_alternates(translation_key).values())
+        cache.set(translation_urls_key(translation_key), urls, None)
+    return urls.get(language_code, '/')
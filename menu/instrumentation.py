@@ -0,0 +1,93 @@
+import functools
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Per-tag wall time and query count, switched on with MENU_TAG_TIMING = True in settings
+# When off, instrument_tag() hands back the undecorated function and MenuTagTimingMiddleware
+# takes itself out of the middleware chain, so nothing is added to a request.
+MENU_TAG_TIMING = getattr(settings, 'MENU_TAG_TIMING', False)
+
+# Per-request totals, {tag name: [calls, seconds, queries]}
+# Set up by tag_timing() - MenuTagTimingMiddleware wraps every request in one.
+# Tags called outside of a timing block (management commands, shell) aren't recorded.
+_state = Local()
+
+
+@contextmanager
+def tag_timing():
+    # collect tag timings until the block exits, yields the totals dict
+    # nested blocks share the outer totals
+    timings = getattr(_state, 'timings', None)
+    if timings is not None:
+        yield timings
+        return
+    _state.timings = timings = {}
+    try:
+        yield timings
+    finally:
+        _state.timings = None
+
+
+def instrument_tag(func):
+    # record the wall time and number of queries of each call to func in the current timing block
+    # times are inclusive - a tag that calls another tag (eg language_switcher -> get_lang_flag)
+    # counts the inner call's time and queries as well
+    if not MENU_TAG_TIMING:
+        return func
+
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = getattr(_state, 'timings', None)
+        if timings is None:
+            return func(*args, **kwargs)
+
+        queries = [0]
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                return func(*args, **kwargs)
+        finally:
+            totals = timings.setdefault(name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += time.perf_counter() - start
+            totals[2] += queries[0]
+
+    return wrapper
+
+
+def server_timing(timings):
+    # Server-Timing header value, one metric per tag with the duration in ms
+    # eg menu-get_menu;dur=1.42;desc="2 calls, 1 queries"
+    return ', '.join(
+        f'menu-{name};dur={seconds * 1000:.2f};desc="{calls} calls, {queries} queries"'
+        for name, (calls, seconds, queries) in timings.items()
+    )
+
+
+def log_timings(request, timings):
+    # one log line per tag, the figures are also passed as extra fields for structured handlers
+    for name, (calls, seconds, queries) in timings.items():
+        logger.info(
+            "menu tag %s: path=%s calls=%d ms=%.2f queries=%d",
+            name, request.path, calls, seconds * 1000, queries,
+            extra={
+                'menu_tag': name,
+                'path': request.path,
+                'calls': calls,
+                'duration_ms': round(seconds * 1000, 2),
+                'queries': queries,
+            }
+        )
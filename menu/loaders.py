@@ -0,0 +1,186 @@
+from collections import defaultdict, namedtuple
+
+from django.db import connection
+from django.db.models import CharField, F, Q
+from django.db.models.expressions import OrderBy, Window
+from django.db.models.functions import RowNumber, Substr
+from wagtail_localize.synctree import Page as LocalizePage
+
+from .localization import localize_objects
+from .models import AutofillMenuItem, LinkMenuItem, Menu, SubMenuItem
+from .page_urls import get_page_urls
+
+# The orderables of one menu, as loaded by load_menu_items()
+# link and autofill items carry the page to use in the active locale as item.localized_page
+# submenu items carry the menu to load in the active locale as item.localized_submenu
+# autofill items carry the child pages to list as item.autofill_pages
+# page_urls maps the id of every one of those pages to its url
+LoadedMenuItems = namedtuple(
+    'LoadedMenuItems', ['sub_menu_items', 'link_menu_items', 'autofill_menu_items', 'page_urls']
+)
+
+
+def localize_pages(pages, locale):
+    # bulk version of page.localized for a list of pages
+    # returns {page id: page in locale}, falls back to the page itself if there is no live translation
+    pages = [page for page in pages if page is not None]
+    return {page.id: localized for page, localized in zip(pages, localize_objects(pages, locale))}
+
+
+def localize_menus(menu_ids, locale):
+    # bulk version of Menu.objects.get(id=menu_id).localized, icons included
+    # returns {menu id: menu in locale}, ids with no matching menu are left out
+    menus = list(Menu.objects.filter(id__in=menu_ids).select_related('icon'))
+    return {
+        menu.id: localized
+        for menu, localized in zip(menus, localize_objects(menus, locale, select_related=['icon']))
+    }
+
+
+def _parent_path():
+    # treebeard path of the parent page - each level adds steplen characters to the path
+    return Substr('path', 1, (F('depth') - 1) * LocalizePage.steplen, output_field=CharField())
+
+
+def _autofill_ordering(order_by):
+    # AutofillMenuItem.order_by as an expression list, path breaks ties so results are stable
+    return [
+        OrderBy(F(order_by.lstrip('-')), descending=order_by.startswith('-')),
+        F('path').asc(),
+    ]
+
+
+def _windowed_children(children, order_by, limit):
+    # number the children of each parent in order_by order and keep the first limit of them
+    # in the database - menu_row_number numbers the 'show in menus' children separately so
+    # items set to only_show_in_menus get their full quota too
+    # Django can't filter on a window annotation, so the query is wrapped in an outer select
+    children = children.order_by().annotate(
+        parent_path=_parent_path(),
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[_parent_path()],
+            order_by=_autofill_ordering(order_by),
+        ),
+        menu_row_number=Window(
+            expression=RowNumber(),
+            partition_by=[_parent_path(), F('show_in_menus')],
+            order_by=_autofill_ordering(order_by),
+        ),
+    )
+    sql, params = children.query.sql_with_params()
+    return LocalizePage.objects.raw(
+        f'SELECT * FROM ({sql}) windowed '
+        'WHERE windowed.row_number <= %s OR (windowed.show_in_menus AND windowed.menu_row_number <= %s) '
+        'ORDER BY windowed.row_number',
+        params + (limit, limit),
+    )
+
+
+def _ordered_children(children, order_by):
+    # fallback for databases without window functions (SQLite before 3.25)
+    # fetches every candidate child in one query and leaves the cut to the caller
+    children = children.order_by(*_autofill_ordering(order_by))
+    for page in children:
+        page.parent_path = page.path[:(page.depth - 1) * LocalizePage.steplen]
+        yield page
+
+
+def load_autofill_pages(items, authenticated):
+    # resolve the listed children of all the autofill items together, one query per ordering
+    # rather than one per item, with the top max_items per parent picked by a row number window
+    # item.localized_page must be set - the children listed are those of the page in the active locale
+    # children are live, public as well if not authenticated, 'show in menus' if only_show_in_menus
+    # items hidden for this authentication state are skipped
+    groups = defaultdict(list)
+    for item in items:
+        item.autofill_pages = []
+        if item.show(authenticated) and item.localized_page is not None and item.max_items > 0:
+            groups[item.order_by].append(item)
+
+    for order_by, group in groups.items():
+        parents = {item.localized_page.path: item.localized_page for item in group}
+        children = LocalizePage.objects.live()
+        if not authenticated:
+            children = children.public()
+        children = children.filter(Q(
+            *[Q(path__startswith=parent.path, depth=parent.depth + 1) for parent in parents.values()],
+            _connector=Q.OR,
+        ))
+        if connection.features.supports_over_clause:
+            children = _windowed_children(children, order_by, max(item.max_items for item in group))
+        else:
+            children = _ordered_children(children, order_by)
+
+        children_by_parent = defaultdict(list)
+        for page in children:
+            children_by_parent[page.parent_path].append(page)
+
+        for item in group:
+            pages = children_by_parent[item.localized_page.path]
+            if item.only_show_in_menus:
+                pages = [page for page in pages if page.show_in_menus]
+            item.autofill_pages = pages[:item.max_items]
+
+
+def load_menu_items(menu_ids, locale, authenticated):
+    # fetch every orderable of the given menus in one pass - works for a single menu or a whole tree
+    # linked pages and icons are joined in, translations of linked pages are resolved in bulk
+    # submenus and their icons are joined into the submenu item query
+    # query count is fixed (3 item queries + 1 page and 1 submenu translation query
+    # + 1 autofill query per ordering in use) regardless of the number of items
+    # returns {menu id: LoadedMenuItems}, menus with no items get empty lists
+    menu_ids = list(menu_ids)
+    page_urls = {}
+    loaded = {menu_id: LoadedMenuItems([], [], [], page_urls) for menu_id in menu_ids}
+
+    sub_menu_items = (
+        SubMenuItem.objects.filter(menu_id__in=menu_ids)
+        .select_related('submenu', 'submenu__icon')
+        .order_by('menu_id', 'sort_order')
+    )
+    link_menu_items = (
+        LinkMenuItem.objects.filter(menu_id__in=menu_ids)
+        .select_related('link_page', 'icon')
+        .order_by('menu_id', 'sort_order')
+    )
+    autofill_menu_items = (
+        AutofillMenuItem.objects.filter(menu_id__in=menu_ids)
+        .select_related('link_page')
+        .order_by('menu_id', 'sort_order')
+    )
+
+    for item in sub_menu_items:
+        loaded[item.menu_id].sub_menu_items.append(item)
+    for item in link_menu_items:
+        loaded[item.menu_id].link_menu_items.append(item)
+    for item in autofill_menu_items:
+        loaded[item.menu_id].autofill_menu_items.append(item)
+
+    # resolve the linked pages of all items in the active locale together
+    page_items = [
+        item
+        for items in loaded.values()
+        for item in items.link_menu_items + items.autofill_menu_items
+    ]
+    localized = localize_pages([item.link_page for item in page_items], locale)
+    for item in page_items:
+        item.localized_page = localized.get(item.link_page_id)
+
+    # the pages listed by the autofill items, depending on authenticated
+    autofill_items = [item for items in loaded.values() for item in items.autofill_menu_items]
+    load_autofill_pages(autofill_items, authenticated)
+
+    # urls of all the linked and listed pages in one go, shared by all the menus
+    pages = [item.localized_page for item in page_items if item.localized_page is not None]
+    pages += [page for item in autofill_items for page in item.autofill_pages]
+    page_urls.update(get_page_urls(pages))
+
+    # and the submenus they load in the active locale, with their titles and icons
+    # submenus already in the locale need no query, translations are fetched together
+    submenu_items = [item for items in loaded.values() for item in items.sub_menu_items]
+    localized = localize_objects([item.submenu for item in submenu_items], locale, select_related=['icon'])
+    for item, submenu in zip(submenu_items, localized):
+        item.localized_submenu = submenu
+
+    return loaded
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.utils import translation
+from wagtail.core.utils import get_supported_content_language_variant
+from wagtail_localize.synctree import Locale
+
+from .cache import VersionedRegistry
+
+# Every locale by id and language code, so the menu tags and views can find the active and default
+# locale without a query. A VersionedRegistry, bumped when a locale is saved or deleted (menu.signals).
+LOCALE_REGISTRY_VERSION_KEY = 'locale-registry-version'
+
+
+def load_locales():
+    # (locales, by id, by language code)
+    locales = list(Locale.objects.all())
+    return (
+        locales,
+        {locale.id: locale for locale in locales},
+        {locale.language_code: locale for locale in locales},
+    )
+
+
+locale_registry = VersionedRegistry(LOCALE_REGISTRY_VERSION_KEY, load_locales)
+
+
+def get_locales():
+    # all locales, in the order Locale.objects.all() gives them
+    return locale_registry.get()[0]
+
+
+def get_locale(locale_id):
+    # the locale with the id, None if there isn't one
+    return locale_registry.get()[1].get(locale_id)
+
+
+def get_locale_by_code(language_code):
+    # the locale with exactly this language code, None if there isn't one
+    return locale_registry.get()[2].get(language_code)
+
+
+def get_locale_for_language(language_code):
+    # the locale for a language, mapped to a content language as Locale.objects.get_for_language does
+    # (en-gb -> en), None if there isn't one
+    if not language_code:
+        return None
+    try:
+        return get_locale_by_code(get_supported_content_language_variant(language_code))
+    except LookupError:
+        return None
+
+
+def get_default_locale():
+    # as Locale.get_default(), raises Locale.DoesNotExist if there is no locale for LANGUAGE_CODE
+    locale = get_locale_for_language(settings.LANGUAGE_CODE)
+    if locale is None:
+        raise Locale.DoesNotExist(f"No locale for LANGUAGE_CODE {settings.LANGUAGE_CODE}")
+    return locale
+
+
+def get_active_locale():
+    # as Locale.get_active(), the locale of the active language or the default locale
+    return get_locale_for_language(translation.get_language()) or get_default_locale()
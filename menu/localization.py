@@ -0,0 +1,65 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from wagtail_localize.synctree import Page as LocalizePage
+
+# Per-request memo for localize_objects(), keyed on (model, pk, locale id)
+# Set up by localization_memo() - LocalizationMemoMiddleware wraps every request in one.
+# Outside of a memo block (management commands, shell) nothing is kept between calls.
+_state = Local()
+
+
+def request_memo():
+    # the memo of the current localization_memo() block, None outside of one
+    # other per-request lookups can keep their results here under keys that aren't (model, pk, locale id)
+    return getattr(_state, 'memo', None)
+
+
+@contextmanager
+def localization_memo():
+    # memoize localized objects until the block exits, nested blocks share the outer memo
+    if getattr(_state, 'memo', None) is not None:
+        yield
+        return
+    _state.memo = {}
+    try:
+        yield
+    finally:
+        _state.memo = None
+
+
+def localize_objects(objects, locale, select_related=()):
+    # bulk version of .localized for pages and snippets - one query per model for all the objects
+    # returns the objects in locale, in the same order as supplied (None stays None)
+    # pages fall back to themselves if the translation isn't live, as Page.localized does,
+    # snippets fall back to themselves if there is no translation, as TranslatableMixin.localized does
+    memo = getattr(_state, 'memo', None)
+    if memo is None:
+        memo = {}
+    objects = list(objects)
+
+    pending = defaultdict(dict)
+    for obj in objects:
+        if obj is None or obj.locale_id == locale.id:
+            continue
+        if (type(obj), obj.pk, locale.id) not in memo:
+            pending[type(obj)][obj.pk] = obj
+
+    for model, untranslated in pending.items():
+        translations = model._default_manager.filter(
+            translation_key__in={obj.translation_key for obj in untranslated.values()},
+            locale_id=locale.id,
+        )
+        if issubclass(model, LocalizePage):
+            translations = translations.filter(live=True)
+        if select_related:
+            translations = translations.select_related(*select_related)
+        translations = {translation.translation_key: translation for translation in translations}
+        for pk, obj in untranslated.items():
+            memo[(model, pk, locale.id)] = translations.get(obj.translation_key, obj)
+
+    return [
+        obj if obj is None or obj.locale_id == locale.id else memo[(type(obj), obj.pk, locale.id)]
+        for obj in objects
+    ]
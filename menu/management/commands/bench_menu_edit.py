@@ -0,0 +1,76 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from wagtail.snippets.views.snippets import get_snippet_edit_handler
+
+from menu.benchmark import measure, summarize
+from menu.models import Menu, SubMenuItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the edit handlers of the Menu snippet edit view. Gives the menu extra submenu items "
+        "for the run (rolled back afterwards) and times building the bound handlers and form as the edit "
+        "view does, and rendering the form, writing latency percentiles and query counts as json."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu', type=int, default=1, help="Menu to edit (default 1)")
+        parser.add_argument('--submenus', type=int, default=30, help="Submenu items to add to the menu (default 30)")
+        parser.add_argument('--iterations', type=int, default=30, help="Timed runs of each case (default 30)")
+        parser.add_argument('--output', help="Write the json to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        if options['submenus'] < 0 or options['iterations'] < 1:
+            raise CommandError("iterations must be at least 1, submenus can't be negative")
+        menu = Menu.objects.filter(id=options['menu']).first()
+        if menu is None:
+            raise CommandError(f"Menu {options['menu']} does not exist")
+
+        with transaction.atomic():
+            results = self.run_benchmarks(menu, options)
+            transaction.set_rollback(True)
+
+        report = json.dumps({
+            'config': {name: options[name] for name in ('menu', 'submenus', 'iterations')},
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(report)
+
+    def run_benchmarks(self, menu, options):
+        # add the submenus, pointing at any other menu in the locale
+        submenu = Menu.objects.filter(locale_id=menu.locale_id).exclude(id=menu.id).first() or menu
+        SubMenuItem.objects.bulk_create([
+            SubMenuItem(menu=menu, submenu_id=submenu.id, menu_display_order=order, locale_id=menu.locale_id)
+            for order in range(options['submenus'])
+        ])
+
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            user = get_user_model().objects.create_superuser('bench-menu-edit', 'bench@example.com', None)
+        request_factory = RequestFactory()
+
+        def build():
+            # as wagtail.snippets.views.snippets.edit builds the handlers for a GET, in a new request
+            request = request_factory.get(f'/admin/snippets/menu/menu/{menu.id}/')
+            request.user = user
+            instance = Menu.objects.get(id=menu.id)
+            edit_handler = get_snippet_edit_handler(Menu).bind_to(instance=instance, request=request)
+            form = edit_handler.get_form_class()(instance=instance)
+            return edit_handler.bind_to(form=form)
+
+        # the first build in a process includes the one-off model binding
+        build()
+        samples = {'build': [], 'build_and_render': []}
+        for i in range(options['iterations']):
+            samples['build'].append(measure(build))
+            samples['build_and_render'].append(measure(lambda: build().render_form_content()))
+        return {case: summarize(runs) for case, runs in samples.items()}
@@ -0,0 +1,252 @@
+import json
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.utils import timezone, translation
+from wagtail.images.models import Image
+from wagtail_localize.synctree import Locale, Page
+
+from blog.models import BlogCategory, BlogIndexPage, BlogPostPage
+from home.models import HomePage
+from menu.benchmark import measure, summarize
+from menu.cache import bump_menu_generation
+from menu.localization import localization_memo
+from menu.models import AutofillMenuItem, LinkMenuItem, Menu, SubMenuItem
+from menu.templatetags.menu_tags import get_menu, get_menu_items
+
+
+def per_request(call):
+    # call with its own localization memo, as a request has
+    def run():
+        with localization_memo():
+            return call()
+    return run
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the menus against a synthetic menu tree and page tree. "
+        "The items of the main menu are replaced by the synthetic tree for the run and everything is "
+        "rolled back afterwards. Times get_menu_items and the full menus/main_menu.html render for "
+        "anonymous and logged in requests, with a cold and a warm menu cache, and writes latency "
+        "percentiles and query counts as json."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--menu', type=int, default=1, help="Menu rendered by main_menu.html (default 1)")
+        parser.add_argument('--width', type=int, default=5, help="Link items in each menu (default 5)")
+        parser.add_argument('--submenus', type=int, default=2, help="Submenus in each menu above the last level (default 2)")
+        parser.add_argument('--depth', type=int, default=3, help="Levels of menus including the top level (default 3)")
+        parser.add_argument('--locales', type=int, default=None, help="Number of locales to translate the menus into and benchmark (default all)")
+        parser.add_argument('--pages', type=int, default=50, help="Blog posts in the synthetic page tree, per locale (default 50)")
+        parser.add_argument('--iterations', type=int, default=30, help="Timed runs of each case per locale (default 30)")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the fixtures (default 0)")
+        parser.add_argument('--output', help="Write the json to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        if options['depth'] < 1 or options['width'] < 0 or options['submenus'] < 0 or options['iterations'] < 1:
+            raise CommandError("depth and iterations must be at least 1, width and submenus can't be negative")
+        self.random = random.Random(options['seed'])
+
+        root = Menu.objects.filter(id=options['menu']).first()
+        if root is None:
+            raise CommandError(f"Menu {options['menu']} does not exist")
+        locales = [root.locale] + list(Locale.objects.exclude(id=root.locale_id).order_by('language_code'))
+        if options['locales'] is not None:
+            locales = locales[:max(options['locales'], 1)]
+
+        try:
+            with transaction.atomic():
+                # the page tree is created in every locale so language_switcher finds a translation for each
+                pages = self.create_pages(
+                    locales + list(Locale.objects.exclude(id__in=[locale.id for locale in locales])), options['pages']
+                )
+                fixture = self.create_menus(root, locales, pages, options)
+                results = self.run(locales, pages, options)
+                transaction.set_rollback(True)
+        finally:
+            # synthetic rows are gone, their ids can be reused - drop anything cached from them
+            bump_menu_generation()
+
+        report = json.dumps({
+            'config': {name: options[name] for name in (
+                'menu', 'width', 'submenus', 'depth', 'pages', 'iterations', 'seed'
+            )},
+            'locales': [locale.language_code for locale in locales],
+            'fixture': fixture,
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(report)
+
+    def create_pages(self, locales, count):
+        # a blog index with count posts under the home page of each locale, all translations of each other
+        # pages created in one locale may already have been copied to others by locale synchronization,
+        # those copies are used as they are
+        # posts need an image and a category, the site's own are reused
+        # returns {locale id: [index, post, post ...]}
+        image = Image.objects.first()
+        if image is None:
+            raise CommandError("Upload an image first, the synthetic blog posts need one")
+        now = timezone.now()
+        index_key = uuid.uuid4()
+        post_keys = [uuid.uuid4() for i in range(count)]
+        published = [now - timedelta(minutes=self.random.randint(0, 525600)) for i in range(count)]
+        show_in_menus = [self.random.random() < 0.5 for i in range(count)]
+        pages = {}
+        for locale in locales:
+            home = HomePage.objects.filter(locale=locale).first()
+            if home is None:
+                raise CommandError(f"No home page in locale {locale.language_code} for the synthetic pages")
+            category = BlogCategory.objects.filter(locale=locale).first()
+            if category is None:
+                raise CommandError(f"No blog category in locale {locale.language_code} for the synthetic posts")
+            existing = {
+                page.translation_key: page
+                for page in Page.objects.filter(locale=locale, translation_key__in=[index_key] + post_keys).specific()
+            }
+            index = existing.get(index_key) or home.add_child(instance=BlogIndexPage(
+                title=f"Benchmark {locale.language_code}", slug='menu-benchmark',
+                locale=locale, translation_key=index_key,
+                first_published_at=now, last_published_at=now,
+            ))
+            pages[locale.id] = [index]
+            for i in range(count):
+                pages[locale.id].append(existing.get(post_keys[i]) or index.add_child(instance=BlogPostPage(
+                    title=f"Benchmark post {i} {locale.language_code}", slug=f'post-{i}',
+                    locale=locale, translation_key=post_keys[i], body='[]', image=image, category=category,
+                    show_in_menus=show_in_menus[i],
+                    first_published_at=published[i], last_published_at=published[i],
+                )))
+        return pages
+
+    def create_menus(self, root, locales, pages, options):
+        # replace the items of root (and its translations in locales) with the synthetic tree
+        # each menu has width links, an autofill from the blog index and, above the last level, submenus
+        # translations share translation keys and submenu ids point at the original menu, as in the admin
+        tree = self.menu_spec(options['width'], options['submenus'], options['depth'])
+        menus = {}
+        counts = {'menus': 0, 'link_menu_items': 0, 'autofill_menu_items': 0, 'sub_menu_items': 0}
+
+        def materialize(spec, menu, locale):
+            counts['menus'] += 1
+            links, autofills, submenus = [], [], []
+            for order, item in enumerate(spec, start=1):
+                common = {
+                    'menu': menu, 'locale': locale, 'translation_key': item['key'],
+                    'menu_display_order': order * 10, 'show_when': item['show_when'],
+                    'show_divider_after_this_item': item['divider'],
+                }
+                if item['type'] == 'link':
+                    links.append(LinkMenuItem(
+                        title=item['title'], link_page=pages[locale.id][item['page'] % len(pages[locale.id])], **common
+                    ))
+                elif item['type'] == 'autofill':
+                    autofills.append(AutofillMenuItem(
+                        link_page=pages[locale.id][0], include_linked_page=item['include_linked_page'],
+                        only_show_in_menus=item['only_show_in_menus'], max_items=item['max_items'],
+                        order_by=item['order_by'], **common
+                    ))
+                else:
+                    submenu = menus.get((item['menu_key'], locale.id))
+                    if submenu is None:
+                        submenu = Menu.objects.create(
+                            title=f"{item['title']} {locale.language_code}",
+                            locale=locale, translation_key=item['menu_key'],
+                        )
+                        menus[(item['menu_key'], locale.id)] = submenu
+                    original = menus[(item['menu_key'], root.locale_id)]
+                    submenus.append(SubMenuItem(submenu_id=original.id, **common))
+                    materialize(item['items'], submenu, locale)
+            LinkMenuItem.objects.bulk_create(links)
+            AutofillMenuItem.objects.bulk_create(autofills)
+            SubMenuItem.objects.bulk_create(submenus)
+            counts['link_menu_items'] += len(links)
+            counts['autofill_menu_items'] += len(autofills)
+            counts['sub_menu_items'] += len(submenus)
+
+        for locale in locales:
+            menu = Menu.objects.filter(translation_key=root.translation_key, locale=locale).first()
+            if menu is None:
+                menu = Menu.objects.create(title=root.title, locale=locale, translation_key=root.translation_key)
+            for model in (LinkMenuItem, AutofillMenuItem, SubMenuItem):
+                model.objects.filter(menu=menu).delete()
+            materialize(tree, menu, locale)
+        counts['pages'] = sum(len(locale_pages) for locale_pages in pages.values())
+        return counts
+
+    def menu_spec(self, width, submenus, depth):
+        # the locale independent description of a menu and, recursively, its submenus
+        items = []
+        for i in range(width):
+            items.append({
+                'type': 'link', 'key': uuid.uuid4(),
+                'title': None if self.random.random() < 0.5 else f"Link {i}",
+                'page': self.random.randint(0, 1 << 30),
+                'show_when': self.random.choice(['always', 'always', 'always', 'logged_in', 'not_logged_in']),
+                'divider': self.random.random() < 0.2,
+            })
+        items.append({
+            'type': 'autofill', 'key': uuid.uuid4(),
+            'include_linked_page': self.random.random() < 0.5,
+            'only_show_in_menus': self.random.random() < 0.3,
+            'max_items': max(width, 1),
+            'order_by': self.random.choice([choice for choice, label in AutofillMenuItem._meta.get_field('order_by').choices]),
+            'show_when': 'always', 'divider': True,
+        })
+        if depth > 1:
+            for i in range(submenus):
+                items.append({
+                    'type': 'submenu', 'key': uuid.uuid4(), 'menu_key': uuid.uuid4(),
+                    'title': f"Submenu {depth}.{i}", 'items': self.menu_spec(width, submenus, depth - 1),
+                    'show_when': 'always', 'divider': False,
+                })
+        self.random.shuffle(items)
+        return items
+
+    def run(self, locales, pages, options):
+        # time each case in each locale, cold (menu generation bumped before every run) and warm
+        # every run gets its own localization memo, as a request does
+        factory = RequestFactory()
+        users = {'anonymous': AnonymousUser(), 'authenticated': get_user_model()(username='menu-benchmark')}
+        samples = {}
+        for locale in locales:
+            page = pages[locale.id][0]
+            with translation.override(locale.language_code):
+                for user_type, user in users.items():
+                    request = factory.get(page.url)
+                    request.user = user
+                    cases = {
+                        'get_menu_items': per_request(lambda: get_menu_items(get_menu(options['menu']), request)),
+                        'main_menu.html': per_request(lambda: render_to_string(
+                            'menus/main_menu.html', {'self': page, 'page': page}, request=request
+                        )),
+                    }
+                    for case, call in cases.items():
+                        for state in ('cold', 'warm'):
+                            runs = samples.setdefault(case, {}).setdefault(user_type, {}).setdefault(state, [])
+                            if state == 'warm':
+                                measure(call)
+                            for i in range(options['iterations']):
+                                if state == 'cold':
+                                    bump_menu_generation()
+                                runs.append(measure(call))
+
+        return {
+            case: {
+                user_type: {state: summarize(runs) for state, runs in states.items()}
+                for user_type, states in user_types.items()
+            }
+            for case, user_types in samples.items()
+        }
@@ -0,0 +1,92 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from wagtail.images import get_image_model
+
+from blog.models import BlogPostPage
+from menu.company_logo import COMPANY_LOGO_FILTERS
+from menu.flags import FLAG_TITLE_PREFIX, LANGUAGE_FLAG_FILTER
+from menu.models import CompanyLogo, LinkMenuItem, Menu
+from menu.renditions import generate_renditions, init_worker, missing_renditions
+from menu.views import MENU_API_ICON_FILTER
+
+# (model, image field, filter specs) - the renditions the templates ask for
+# keep in step with the {% image %} tags in the templates
+RENDITION_SPECS = [
+    (Menu, 'icon', ['fill-25x25', MENU_API_ICON_FILTER]),
+    (LinkMenuItem, 'icon', ['fill-25x25', MENU_API_ICON_FILTER]),
+    (BlogPostPage, 'image', ['fill-150x150', 'fill-1200x500']),
+    (CompanyLogo, 'logo', COMPANY_LOGO_FILTERS),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the renditions the templates use (menu icons, flags, blog thumbnails and banners, "
+        "the company logo) that don't exist yet, with a pool of worker processes. "
+        "Existing renditions are skipped, so an interrupted run carries on where it left off when run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Number of worker processes (default one per cpu)",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="List the missing renditions without generating them",
+        )
+
+    def handle(self, *args, **options):
+        # {image id: {filter spec, ...}} for every image the templates render
+        image_filter_specs = {}
+        for model, field, filter_specs in RENDITION_SPECS:
+            image_ids = model.objects.filter(**{f'{field}__isnull': False}).values_list(f'{field}_id', flat=True)
+            for image_id in image_ids:
+                image_filter_specs.setdefault(image_id, set()).update(filter_specs)
+        flag_ids = get_image_model().objects.filter(title__startswith=FLAG_TITLE_PREFIX).values_list('id', flat=True)
+        for image_id in flag_ids:
+            image_filter_specs.setdefault(image_id, set()).add(LANGUAGE_FLAG_FILTER)
+
+        missing = missing_renditions(image_filter_specs)
+        total = sum(len(filter_specs) for filter_specs in missing.values())
+        self.stdout.write(
+            f"{sum(len(filter_specs) for filter_specs in image_filter_specs.values()) - total} renditions exist, "
+            f"{total} to generate for {len(missing)} images"
+        )
+        if options['dry_run']:
+            for image_id, filter_specs in missing.items():
+                self.stdout.write(f"  image {image_id}: {', '.join(filter_specs)}")
+            return
+        if not missing:
+            return
+
+        # forked workers mustn't share the parent's database connections
+        connections.close_all()
+        started = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=max(options['workers'], 1),
+            initializer=init_worker,
+        ) as executor:
+            futures = [
+                executor.submit(generate_renditions, image_id, filter_specs)
+                for image_id, filter_specs in missing.items()
+            ]
+            for future in as_completed(futures):
+                image_id, title, generated, errors = future.result()
+                done += len(generated)
+                failed += len(errors)
+                self.stdout.write(
+                    f"[{done + failed}/{total}] image {image_id} {title or ''}: {', '.join(generated) or '-'}"
+                )
+                for filter_spec, message in errors:
+                    self.stderr.write(f"  {filter_spec} failed: {message}")
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(
+            f"Generated {done} renditions in {time.perf_counter() - started:.1f} s, {failed} failed"
+        ))
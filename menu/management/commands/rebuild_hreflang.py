@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from wagtail_localize.synctree import Page
+
+from menu.hreflang import refresh_alternates
+from menu.models import HreflangAlternate
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite the hreflang alternate links of every live page. "
+        "The page signals keep them up to date after this, run it once after migrating "
+        "or after changing the sites or locales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of translation keys to rewrite at a time (default 500)",
+        )
+
+    def handle(self, *args, **options):
+        translation_keys = list(
+            Page.objects.live().filter(depth__gt=1).order_by().values_list('translation_key', flat=True).distinct()
+        )
+        batch_size = max(options['batch_size'], 1)
+        for start in range(0, len(translation_keys), batch_size):
+            refresh_alternates(translation_keys[start:start + batch_size])
+        # groups whose pages are all gone or no longer live
+        HreflangAlternate.objects.exclude(translation_key__in=translation_keys).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {HreflangAlternate.objects.count()} alternate links for {len(translation_keys)} pages"
+        ))
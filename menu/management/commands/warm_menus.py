@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from menu.cache import get_menu_generation, set_compiled_menus
+from menu.loaders import localize_menus
+from menu.locales import get_locales
+from menu.localization import localization_memo
+from menu.models import Menu
+from menu.templatetags.menu_tags import build_menu_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile every menu for every locale and both login states and store it in the cache, "
+        "so the first requests after a deploy don't pay for building the menus. "
+        "Only useful with a cache shared by the web workers (not the default local memory cache)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of menus to build at the same time (default 4)",
+        )
+
+    def handle(self, *args, **options):
+        # the menus served in each locale - its own translations, or the originals where there are none
+        menu_ids = list(Menu.objects.values_list('id', flat=True))
+        jobs = []
+        for locale in get_locales():
+            localized = localize_menus(menu_ids, locale)
+            for menu in {menu.id: menu for menu in localized.values()}.values():
+                for authenticated in (False, True):
+                    jobs.append((locale.language_code, menu, authenticated))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            results = list(executor.map(lambda job: self.warm(*job), jobs))
+        elapsed = time.perf_counter() - started
+
+        for language_code, menu, authenticated, duration, queries in results:
+            self.stdout.write(
+                f"{menu.id} {menu.title} [{language_code}, "
+                f"{'logged in' if authenticated else 'anonymous'}]: {duration * 1000:.1f} ms, {queries} queries"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {len(results)} menus in {elapsed:.2f} s "
+            f"({sum(result[4] for result in results)} queries)"
+        ))
+
+    def warm(self, language_code, menu, authenticated):
+        # build one menu the same way get_menu_items does on a cache miss, runs in a worker thread
+        try:
+            # the generation from before the build - if a change is saved while building, the menu
+            # is stored under the old generation rather than passed off as the new one
+            generation = get_menu_generation()
+            with translation.override(language_code), localization_memo(), \
+                    CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                compiled = build_menu_items([menu.id], authenticated)
+                duration = time.perf_counter() - started
+            set_compiled_menus(compiled, language_code, authenticated, generation)
+            return language_code, menu, authenticated, duration, len(queries)
+        finally:
+            # each worker thread has its own connections
+            connections.close_all()
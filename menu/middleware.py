@@ -0,0 +1,40 @@
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation import MENU_TAG_TIMING, log_timings, server_timing, tag_timing
+from .localization import localization_memo
+
+
+class LocalizationMemoMiddleware:
+    """ Resolve each object's translation at most once per request
+        Wraps the request in localization_memo() so localize_objects() results are shared by
+        every menu tag (and anything else) that runs while the response is built.
+        Template responses are rendered before the response comes back up the middleware chain """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with localization_memo():
+            return self.get_response(request)
+
+
+class MenuTagTimingMiddleware:
+    """ Report the time and queries spent in the menu template tags for each request
+        Adds the per-tag totals as a Server-Timing header and logs them to menu.instrumentation.
+        Only active with MENU_TAG_TIMING = True, otherwise removed from the chain at startup """
+
+    def __init__(self, get_response):
+        if not MENU_TAG_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with tag_timing() as timings:
+            response = self.get_response(request)
+        if timings:
+            header = server_timing(timings)
+            if response.has_header('Server-Timing'):
+                header = f"{response['Server-Timing']}, {header}"
+            response['Server-Timing'] = header
+            log_timings(request, timings)
+        return response
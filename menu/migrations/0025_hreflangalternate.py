@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-17 23:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailcore', '0059_apply_collection_ordering'),
+        ('menu', '0024_autofillmenuitem_only_show_in_menus'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HreflangAlternate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('translation_key', models.UUIDField()),
+                ('hreflang', models.CharField(max_length=100)),
+                ('url', models.TextField()),
+                ('full_url', models.TextField()),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wagtailcore.page')),
+            ],
+            options={
+                'unique_together': {('translation_key', 'hreflang')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0025_hreflangalternate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['locale', 'title'], name='menu_locale_title_idx'),
+        ),
+    ]
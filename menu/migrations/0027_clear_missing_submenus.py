@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def clear_missing_submenus(apps, schema_editor):
+    # submenu_id becomes a foreign key in the next migration, ids of menus that no longer exist
+    # would break the constraint - they never loaded anything, empty them
+    Menu = apps.get_model('menu', 'Menu')
+    SubMenuItem = apps.get_model('menu', 'SubMenuItem')
+    SubMenuItem.objects.exclude(submenu_id=None).exclude(
+        submenu_id__in=Menu.objects.values('id')
+    ).update(submenu_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0026_menu_locale_title_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_missing_submenus, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    # SubMenuItem.submenu_id (integer) becomes SubMenuItem.submenu (foreign key to Menu)
+    # the column keeps its name and data, the database gets the constraint and index
+
+    dependencies = [
+        ('menu', '0027_clear_missing_submenus'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='submenuitem',
+                    name='submenu_id',
+                    field=models.ForeignKey(db_column='submenu_id', help_text='Select the sub-menu to load', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu.menu', verbose_name='Submenu'),
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='submenuitem',
+                    name='submenu_id',
+                ),
+                migrations.AddField(
+                    model_name='submenuitem',
+                    name='submenu',
+                    field=models.ForeignKey(help_text='Select the sub-menu to load', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='menu.menu', verbose_name='Submenu'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+def set_search_titles(apps, schema_editor):
+    Menu = apps.get_model('menu', 'Menu')
+    menus = list(Menu.objects.only('id', 'title'))
+    for menu in menus:
+        menu.search_title = menu.title.casefold()
+    Menu.objects.bulk_update(menus, ['search_title'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0028_submenuitem_submenu_foreign_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menu',
+            name='search_title',
+            field=models.CharField(default='', editable=False, max_length=150),
+        ),
+        migrations.RunPython(set_search_titles, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='menu',
+            name='menu_locale_title_idx',
+        ),
+        migrations.AddIndex(
+            model_name='menu',
+            index=models.Index(fields=['locale', 'search_title'], name='menu_locale_search_title_idx'),
+        ),
+    ]
@@ -1,17 +1,18 @@
 from django.db import models
-from django.utils.datastructures import MultiValueDictKeyError
 from django.utils.translation import gettext_lazy as _
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
-from wagtail.admin.edit_handlers import (FieldPanel, HelpPanel, InlinePanel,
+from wagtail.admin.edit_handlers import (FieldPanel, HelpPanel,
                                          MultiFieldPanel, PageChooserPanel)
 from wagtail.admin.forms import WagtailAdminPageForm
 from wagtail.core.models import Orderable, TranslatableMixin
 from wagtail.images.edit_handlers import ImageChooserPanel
 from wagtail.snippets.models import register_snippet
+from wagtail_localize.fields import SynchronizedField
 from wagtail_localize.synctree import Locale, Page as LocalizePage
 
-from .edit_handlers import ReadOnlyPanel, RichHelpPanel, SubMenuFieldPanel
+from .edit_handlers import CachedInlinePanel, ReadOnlyPanel, RichHelpPanel, SubMenuFieldPanel
+from .submenu_graph import MENU_MAX_DEPTH, check_submenus
 
 class MenuListQuerySet(object):
     # Call as class()() to act as a function call, passes all menus to SubMenuPanel dropdown
@@ -34,18 +35,22 @@ class MenuForm(WagtailAdminPageForm):
 
     def clean(self, *args, **kwargs):
         cleaned_data = super().clean(*args, **kwargs)
+        parent_id = self.instance.pk
+        submenu_forms = []
         for form in self.formsets['sub_menu_items'].forms:
             if form.is_valid():
                 cleaned_form_data = form.clean()
-                try:
-                    parent_id = self.data['id']
-                except MultiValueDictKeyError as e:
-                    parent_id = None
-                if cleaned_form_data.get('submenu_id') == None:
-                    form.add_error('title_of_submenu', "Sub Menu ID cannot be left blank")
-                if parent_id != None:
-                    if cleaned_form_data.get('submenu_id') == parent_id:
-                        form.add_error('title_of_submenu', "Parent Menu cannot be a Sub Menu of itself")
+                if cleaned_form_data.get('DELETE'):
+                    continue
+                if cleaned_form_data.get('submenu') == None:
+                    form.add_error('submenu', "Sub Menu ID cannot be left blank")
+                elif cleaned_form_data.get('submenu').translation_key == self.instance.translation_key:
+                    # itself or one of its translations, which it would be rendered as
+                    form.add_error('submenu', "Parent Menu cannot be a Sub Menu of itself")
+                else:
+                    submenu_forms.append(form)
+        if submenu_forms:
+            self.clean_submenu_graph(parent_id, submenu_forms)
         for form in self.formsets['link_menu_items'].forms:
             if form.is_valid():
                 cleaned_form_data = form.clean()
@@ -72,17 +77,64 @@ class MenuForm(WagtailAdminPageForm):
 
         return cleaned_data
 
+    def clean_submenu_graph(self, parent_id, submenu_forms):
+        # check every menu reachable from this one, and every menu that loads it, with the submenus as
+        # saved here - indirect cycles (A -> B -> A) and trees deeper than MENU_MAX_DEPTH are rejected
+        # menus are compared by translation key, submenus are rendered as their translations
+        menu_key = self.instance.translation_key
+        submenu_keys = {form.cleaned_data['submenu'].translation_key for form in submenu_forms}
+        cycle, depth = check_submenus(menu_key, submenu_keys)
+        if cycle:
+            msg = _("Sub-menus would load each other in a loop: %(cycle)s") % {
+                'cycle': ' -> '.join(self.describe_menus(cycle, parent_id))
+            }
+            self.add_error(None, msg)
+            # and on the submenus taking part in it, if any
+            for form in submenu_forms:
+                if form.cleaned_data['submenu'].translation_key in cycle:
+                    form.add_error('submenu', msg)
+        if depth > MENU_MAX_DEPTH:
+            msg = _("Menus can be nested %(max)s levels deep, this would make %(depth)s") % {
+                'max': MENU_MAX_DEPTH, 'depth': depth
+            }
+            self.add_error(None, msg)
+
+    def describe_menus(self, menu_keys, parent_id):
+        # "title (id)" for each translation key, preferring the menu in this menu's locale
+        menus = {}
+        for menu in Menu.objects.filter(translation_key__in=set(menu_keys)).order_by('id'):
+            if menu.translation_key not in menus or menu.locale_id == self.instance.locale_id:
+                menus[menu.translation_key] = menu
+        labels = []
+        for key in menu_keys:
+            if key == self.instance.translation_key:
+                labels.append(f'{self.instance.title} ({parent_id})' if parent_id else str(self.instance.title))
+            else:
+                labels.append(f'{menus[key].title} ({menus[key].id})' if key in menus else str(key))
+        return labels
+
 class MenuPanelsIterable(object):
     # Build the panels as an iterable. Probably not necessary here but it could be useful for a bit
     # of dynamic panel building later on
     # The panels for the submenu form are built here and passed into the InlinePanel 
     # rather than declared in the model itself
+    # Built on first use and kept, wagtail binds the Menu edit handler once per process and the
+    # inline panels (CachedInlinePanel) bind their child handlers once, per-request state for the
+    # submenu chooser is kept on the bound form
+
+    def __init__(self):
+        self.panels = None
 
     def __iter__(self):
+        if self.panels is None:
+            self.panels = self.build_panels()
+        return iter(self.panels)
+
+    def build_panels(self):
         # build submenu panels, including the FluidIterable for the widget
         submenu_panels = [
             HelpPanel(_("Select the menu that this sub-menu will load")),
-            SubMenuFieldPanel("submenu_id", MenuListQuerySet()()),
+            SubMenuFieldPanel("submenu", MenuListQuerySet()()),
             FieldPanel("display_option"),
             FieldPanel("show_when"),
             FieldPanel("menu_display_order"),
@@ -117,27 +169,27 @@ class MenuPanelsIterable(object):
             ),
             MultiFieldPanel(
                 [
-                    InlinePanel("sub_menu_items", label=_("Sub-menu"), panels=submenu_panels)
+                    CachedInlinePanel("sub_menu_items", label=_("Sub-menu"), panels=submenu_panels)
                 ],
                 heading="Submenus",
                 classname="collapsible collapsed",
             ),
             MultiFieldPanel(
                 [
-                    InlinePanel("link_menu_items", label=_("Link")),
+                    CachedInlinePanel("link_menu_items", label=_("Link")),
                 ],
                 heading="Links",
                 classname="collapsible collapsed",
             ),
             MultiFieldPanel(
                 [
-                    InlinePanel("autofill_menu_items", label=_("Autofill Link")),
+                    CachedInlinePanel("autofill_menu_items", label=_("Autofill Link")),
                 ],
                 heading="Autofill Links",
                 classname="collapsible collapsed",
             ),
         ]
-        return panels.__iter__()
+        return panels
 
 @register_snippet
 class Menu(TranslatableMixin, ClusterableModel):
@@ -154,6 +206,11 @@ class Menu(TranslatableMixin, ClusterableModel):
         help_text=_("Title will be used if this is a submenu")
     )
 
+    # the title case folded, set on save - the submenu chooser matches the search text against it
+    # as a plain prefix so the lookup can use the (locale, search_title) index
+    # case folding can lengthen a title ('ß' -> 'ss')
+    search_title = models.CharField(max_length=150, editable=False, default='')
+
     # Optional image to display if submenu
     icon = models.ForeignKey(
         "wagtailimages.Image",
@@ -166,9 +223,23 @@ class Menu(TranslatableMixin, ClusterableModel):
     
     panels = MenuPanelsIterable()
 
+    class Meta:
+        unique_together = ('translation_key', 'locale')
+        # the submenu chooser looks up the menus of a locale by search_title prefix, in that order
+        indexes = [
+            models.Index(fields=['locale', 'search_title'], name='menu_locale_search_title_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.search_title = self.title.casefold()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'search_title'}
+        super().save(*args, **kwargs)
+
 class MenuItem(TranslatableMixin, Orderable):
     """ MenuItem Class - orderables to display in Menu class
         Parent class to SubMenuItem and AutoMenuItem classes """
@@ -386,10 +457,14 @@ class SubMenuItem(MenuItem):
         help_text=_("Menu to which this item belongs"),
     )
 
-    # kind of a foreign key, but to the menu table - link to load another menu as submenu
-    submenu_id = models.IntegerField(
+    # the menu to load as submenu, emptied if that menu is deleted
+    # the column is still submenu_id, so item.submenu_id is the id as before
+    submenu = models.ForeignKey(
+        "Menu",
         blank=False,
         null=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
         help_text=_("Select the sub-menu to load"),
         verbose_name=_("Submenu"),
     )
@@ -408,6 +483,12 @@ class SubMenuItem(MenuItem):
 
     # panels = [Declared in Menu and added to InlinePanel]
 
+    # translations load the same submenu, it is shown in the active locale when the menu is built
+    # (wagtail-localize would otherwise want the submenu translated before the menu can be)
+    override_translatable_fields = [
+        SynchronizedField("submenu"),
+    ]
+
     class Meta:
         unique_together = ('translation_key', 'locale')
  
@@ -427,3 +508,24 @@ class CompanyLogo(models.Model):
     def __str__(self):
         return self.name
 
+
+
+class HreflangAlternate(models.Model):
+    """ HreflangAlternate - the url of each live translation of a page, for the alternate links
+        One row per translation_key and language code, plus an 'x-default' row for the version in
+        the default language. Kept up to date by menu.hreflang from the page signals, read by
+        language_switcher and the sitemap with one lookup on translation_key """
+
+    translation_key = models.UUIDField()
+    # language code of the locale, or x-default
+    hreflang = models.CharField(max_length=100)
+    page = models.ForeignKey(LocalizePage, on_delete=models.CASCADE, related_name="+")
+    # page.url and page.full_url when the row was written
+    url = models.TextField()
+    full_url = models.TextField()
+
+    class Meta:
+        unique_together = ('translation_key', 'hreflang')
+
+    def __str__(self):
+        return f'{self.hreflang}: {self.full_url}'
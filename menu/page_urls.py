@@ -0,0 +1,94 @@
+from urllib.parse import quote
+
+from django.conf import settings
+from django.urls import NoReverseMatch, get_script_prefix, reverse
+from django.utils import translation
+from django.utils.http import RFC3986_SUBDELIMS
+from wagtail.core.models import Site
+from wagtail.core.utils import WAGTAIL_APPEND_SLASH, get_supported_content_language_variant
+
+# Bulk version of page.url / page.get_url(request) for menus and listings.
+# Page.get_url_parts() calls reverse() once per page inside a translation override to build
+# the language prefixed url. The url of any page is its url_path below the site root appended
+# to the url of the site root, so the root url is reversed once per language and script prefix
+# (kept here for the life of the process) and the rest is string work.
+# Site root paths come from Site.get_site_root_paths(), which wagtail caches and clears itself.
+_root_page_paths = {}
+
+
+def _root_page_path(language_code):
+    # url of the site root in this language ('/en/'), None if wagtail_serve isn't routable
+    # without WAGTAIL_I18N_ENABLED wagtail reverses it in the active language whatever the site's language
+    if not getattr(settings, 'WAGTAIL_I18N_ENABLED', False):
+        language_code = translation.get_language()
+    key = (language_code, get_script_prefix())
+    if key not in _root_page_paths:
+        try:
+            with translation.override(language_code):
+                _root_page_paths[key] = reverse('wagtail_serve', args=('',))
+        except NoReverseMatch:
+            _root_page_paths[key] = None
+    return _root_page_paths[key]
+
+
+def _active_language_variant():
+    # (content language, active language) - pages in that content language are linked with the
+    # active variant (en -> en-gb), as Page.get_url_parts() does when WAGTAIL_I18N_ENABLED is on
+    if not getattr(settings, 'WAGTAIL_I18N_ENABLED', False):
+        return None, None
+    active = translation.get_language()
+    try:
+        return get_supported_content_language_variant(active), active
+    except LookupError:
+        return None, None
+
+
+def get_page_urls(pages, request=None, full=False):
+    # returns {page id: url} for the pages, the same url page.get_url(request) would give:
+    # relative if there is only one site or the page is on the site of the request,
+    # otherwise including the root url of the site, None if the page isn't routable
+    # with full=True, always includes the root url as page.get_full_url(request) does
+    site_root_paths = getattr(request, '_wagtail_cached_site_root_paths', None)
+    if site_root_paths is None:
+        site_root_paths = Site.get_site_root_paths()
+        if request is not None:
+            request._wagtail_cached_site_root_paths = site_root_paths
+    num_sites = len({root_path.site_id for root_path in site_root_paths})
+    current_site = Site.find_for_request(request) if request is not None else None
+    content_language, active_language = _active_language_variant()
+
+    urls = {}
+    for page in pages:
+        possible_sites = [
+            root_path for root_path in site_root_paths if page.url_path.startswith(root_path.root_path)
+        ]
+        if not possible_sites:
+            urls[page.id] = None
+            continue
+        site_root = possible_sites[0]
+        if current_site:
+            for root_path in possible_sites:
+                if root_path.site_id == current_site.pk:
+                    site_root = root_path
+                    break
+
+        language_code = site_root.language_code
+        if content_language is not None and language_code == content_language:
+            language_code = active_language
+        root_page_path = _root_page_path(language_code)
+        if root_page_path is None:
+            urls[page.id] = None
+            continue
+
+        # safe characters as used by reverse()
+        page_path = root_page_path + quote(
+            page.url_path[len(site_root.root_path):], safe=RFC3986_SUBDELIMS + '/~:@'
+        )
+        if not WAGTAIL_APPEND_SLASH and page_path != '/':
+            page_path = page_path.rstrip('/')
+
+        if not full and ((current_site is not None and site_root.site_id == current_site.pk) or num_sites == 1):
+            urls[page.id] = page_path
+        else:
+            urls[page.id] = site_root.root_url + page_path
+    return urls
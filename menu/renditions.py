@@ -0,0 +1,57 @@
+# Rendition pre-generation for manage.py generate_renditions
+# The worker functions run in a process pool, so the models are only imported once django is set up
+# in the worker (with the spawn start method the worker imports this module before django.setup()).
+
+
+def init_worker():
+    # set up django in a spawned worker, forked workers already have it
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def missing_renditions(image_filter_specs):
+    # {image id: [filter spec, ...]} of the renditions that don't exist yet
+    # image_filter_specs is {image id: {filter spec, ...}}, a rendition exists if one has the filter spec
+    # and the focal point key the image has now (as image.get_rendition() looks it up)
+    from wagtail.images import get_image_model
+    from wagtail.images.models import Filter
+
+    Image = get_image_model()
+    Rendition = Image.get_rendition_model()
+    existing = set(
+        Rendition.objects.filter(image_id__in=image_filter_specs)
+        .values_list('image_id', 'filter_spec', 'focal_point_key')
+    )
+    missing = {}
+    for image in Image.objects.filter(id__in=image_filter_specs).order_by('id'):
+        for filter_spec in sorted(image_filter_specs[image.id]):
+            key = Filter(spec=filter_spec).get_cache_key(image)
+            if (image.id, filter_spec, key) not in existing:
+                missing.setdefault(image.id, []).append(filter_spec)
+    return missing
+
+
+def generate_renditions(image_id, filter_specs):
+    # generate the renditions of one image, returns (image id, title, generated filter specs, errors)
+    # errors are (filter spec, message) - one bad file or filter doesn't stop the others
+    from django.db import connection
+    from wagtail.images import get_image_model
+
+    generated, errors = [], []
+    try:
+        image = get_image_model().objects.get(id=image_id)
+    except get_image_model().DoesNotExist:
+        return image_id, None, generated, [(filter_spec, "image deleted") for filter_spec in filter_specs]
+    try:
+        for filter_spec in filter_specs:
+            try:
+                image.get_rendition(filter_spec)
+                generated.append(filter_spec)
+            except Exception as e:
+                errors.append((filter_spec, str(e)))
+    finally:
+        # the worker may be idle for a while, don't hold a connection open
+        connection.close()
+    return image_id, image.title, generated, errors
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.core.models import PageViewRestriction
+from wagtail.core.signals import page_published, page_unpublished, post_page_move
+from wagtail.images import get_image_model
+from wagtail_localize.synctree import Locale, Page
+
+from .cache import bump_menu_generation
+from .company_logo import get_company_logo, refresh_company_logo
+from .flags import flag_registry
+from .hreflang import refresh_alternates, refresh_descendant_alternates, refresh_page_alternates
+from .locales import locale_registry
+from .url_paths import url_path_index
+from .models import AutofillMenuItem, CompanyLogo, LinkMenuItem, Menu, SubMenuItem
+
+# Any change that can show up in a menu moves all menus on to a new generation, one cache write
+# however many menus, locales and workers there are. The bump waits for the commit, otherwise
+# a request running alongside the admin save could cache the old rows under the new generation.
+# Menus rebuild on demand (or with manage.py warm_menus).
+
+
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=LinkMenuItem)
+@receiver(post_delete, sender=LinkMenuItem)
+@receiver(post_save, sender=AutofillMenuItem)
+@receiver(post_delete, sender=AutofillMenuItem)
+@receiver(post_save, sender=SubMenuItem)
+@receiver(post_delete, sender=SubMenuItem)
+def menu_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_menu_generation)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def page_changed(sender, instance, **kwargs):
+    # titles and urls of linked pages and the autofill lists under them
+    transaction.on_commit(bump_menu_generation)
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+def page_restriction_changed(sender, instance, **kwargs):
+    # privacy changes don't publish the page, anonymous menus leave out restricted pages
+    transaction.on_commit(bump_menu_generation)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def page_alternates_changed(sender, instance, **kwargs):
+    # the page has joined or left its translations' alternate links, or its url has changed
+    transaction.on_commit(lambda: refresh_page_alternates(instance))
+
+
+@receiver(post_page_move)
+def page_moved(sender, instance, url_path_before, url_path_after, **kwargs):
+    # every url at and below the page has changed, reordering siblings changes nothing
+    if url_path_before != url_path_after:
+        transaction.on_commit(lambda: refresh_descendant_alternates(instance))
+
+
+@receiver(post_save)
+def page_created(sender, instance, created, **kwargs):
+    # new live translations and aliases (translations are usually created as drafts and published later)
+    if created and isinstance(instance, Page) and instance.live:
+        transaction.on_commit(lambda: refresh_page_alternates(instance))
+
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+def image_changed(sender, instance, **kwargs):
+    # any image, a flag image may have been renamed and images change rarely
+    transaction.on_commit(flag_registry.bump)
+    # the logo image, its renditions are regenerated straight away
+    # deleting it deletes the CompanyLogo as well (CASCADE), company_logo_changed sees to that
+    logo = get_company_logo()
+    if logo is not None and logo.logo_id == instance.pk:
+        transaction.on_commit(refresh_company_logo)
+    # menu and link icons - the cached menus hold their rendition urls
+    # deleting an icon clears it on the menus (SET_NULL, no signals), saving one only matters if it's used
+    if kwargs['signal'] is post_delete or is_menu_icon(instance):
+        transaction.on_commit(bump_menu_generation)
+
+
+def is_menu_icon(image):
+    return (
+        Menu.objects.filter(icon_id=image.pk).exists()
+        or LinkMenuItem.objects.filter(icon_id=image.pk).exists()
+    )
+
+
+@receiver(post_save, sender=CompanyLogo)
+@receiver(post_delete, sender=CompanyLogo)
+def company_logo_changed(sender, instance, **kwargs):
+    # generate the renditions now rather than on the first page view
+    transaction.on_commit(refresh_company_logo)
+
+
+@receiver(page_published)
+@receiver(post_page_move)
+def page_url_path_changed(sender, instance, **kwargs):
+    # publishing can change the slug, moving changes the url_path of the page and all below it
+    transaction.on_commit(url_path_index.bump)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def page_added_or_deleted(sender, instance, **kwargs):
+    # new pages (including drafts and aliases) and deleted pages
+    if isinstance(instance, Page) and (kwargs.get('created') or kwargs['signal'] is post_delete):
+        transaction.on_commit(url_path_index.bump)
+    if isinstance(instance, Page) and kwargs['signal'] is post_delete:
+        # the rows of the page went with it, its translations' redirect map still has its url
+        transaction.on_commit(lambda: refresh_alternates([instance.translation_key]))
+
+
+@receiver(post_save, sender=Locale)
+@receiver(post_delete, sender=Locale)
+def locale_changed(sender, instance, **kwargs):
+    transaction.on_commit(locale_registry.bump)
@@ -0,0 +1,86 @@
+// Submenu chooser (menu.widgets.SubMenuChooser)
+// Listens on the document so inline forms added after the page loads work as well.
+// Typing fetches the menus whose title starts with the search text, a page at a time;
+// picking one puts its id in the hidden input. Clearing the box clears the choice.
+// The labels come translated from the widget's data attributes.
+(function () {
+    var timer = null;
+
+    function search(chooser, page) {
+        var params = new URLSearchParams({
+            q: chooser.querySelector('.submenu-chooser-search').value,
+            locale: chooser.dataset.locale,
+            exclude: chooser.dataset.exclude,
+            p: page
+        });
+        fetch(chooser.dataset.url + '?' + params, {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (data) { showResults(chooser, data); });
+    }
+
+    function showResults(chooser, data) {
+        var list = chooser.querySelector('.submenu-chooser-results');
+        if (data.page === 1) {
+            list.innerHTML = '';
+        } else {
+            var more = list.querySelector('.submenu-chooser-more');
+            if (more) { more.remove(); }
+        }
+        data.results.forEach(function (menu) {
+            var item = document.createElement('li');
+            item.className = 'submenu-chooser-option';
+            item.dataset.id = menu.id;
+            item.textContent = menu.title + ' (' + menu.id + ')';
+            item.dataset.title = menu.title;
+            list.appendChild(item);
+        });
+        if (data.has_next) {
+            var next = document.createElement('li');
+            next.className = 'submenu-chooser-more';
+            next.dataset.page = data.page + 1;
+            next.textContent = chooser.dataset.moreLabel;
+            list.appendChild(next);
+        }
+        if (!list.children.length) {
+            var empty = document.createElement('li');
+            empty.className = 'submenu-chooser-empty';
+            empty.textContent = chooser.dataset.emptyLabel;
+            list.appendChild(empty);
+        }
+    }
+
+    document.addEventListener('input', function (event) {
+        if (!event.target.classList.contains('submenu-chooser-search')) { return; }
+        var chooser = event.target.closest('.submenu-chooser');
+        if (!event.target.value) {
+            chooser.querySelector('input[type=hidden]').value = '';
+        }
+        clearTimeout(timer);
+        timer = setTimeout(function () { search(chooser, 1); }, 250);
+    });
+
+    document.addEventListener('focusin', function (event) {
+        if (!event.target.classList.contains('submenu-chooser-search')) { return; }
+        search(event.target.closest('.submenu-chooser'), 1);
+    });
+
+    document.addEventListener('click', function (event) {
+        var choosers = document.querySelectorAll('.submenu-chooser');
+        var option = event.target.closest('.submenu-chooser-option, .submenu-chooser-more');
+        if (option) {
+            var chooser = option.closest('.submenu-chooser');
+            if (option.classList.contains('submenu-chooser-more')) {
+                search(chooser, parseInt(option.dataset.page, 10));
+                return;
+            }
+            chooser.querySelector('input[type=hidden]').value = option.dataset.id;
+            chooser.querySelector('.submenu-chooser-search').value = option.dataset.title;
+        }
+        // close the lists of every chooser not being typed in
+        choosers.forEach(function (chooser) {
+            if (!chooser.contains(event.target) || option) {
+                chooser.querySelector('.submenu-chooser-results').innerHTML = '';
+            }
+        });
+    });
+})();
@@ -0,0 +1,93 @@
+from django.conf import settings
+
+from .cache import MENU_GENERATION_KEY, VersionedRegistry
+
+# menu -> the menus it loads as submenus, for every menu, so MenuForm can check the whole graph
+# a save would create for cycles and depth without a query per menu.
+# Menus are keyed on translation_key rather than id: a submenu is rendered as its translation in the
+# page's locale (loaders.load_menu_items), so a menu in one locale can reach a menu in another
+# through their translations. Edges from every locale are merged, a loop is rejected if it would
+# show up in any of them.
+# Built in one query. A VersionedRegistry on the menu generation, bumped by changes to menus and
+# their items (menu.signals).
+
+# levels of submenus a menu can have, including the menu itself - deeper trees aren't saved and
+# aren't rendered (get_menu_tree stops here)
+MENU_MAX_DEPTH = getattr(settings, 'MENU_MAX_DEPTH', 3)
+
+def load_submenu_graph():
+    from .models import SubMenuItem
+
+    graph = {}
+    items = SubMenuItem.objects.exclude(submenu=None).values_list('menu__translation_key', 'submenu__translation_key')
+    for menu_key, submenu_key in items:
+        graph.setdefault(menu_key, set()).add(submenu_key)
+    return graph
+
+
+# versioned by the menu generation, bumped by menu.signals
+submenu_graph = VersionedRegistry(MENU_GENERATION_KEY, load_submenu_graph)
+
+
+def get_submenu_graph():
+    # the graph, rebuilt if a menu has changed since it was built
+    return submenu_graph.get()
+
+
+def longest_paths(graph, start):
+    # depth first from start over graph ({node: children}), each node walked once
+    # returns (cycle, heights): heights[node] is the number of nodes on the longest path down from node,
+    # cycle is the list of nodes going round the first cycle found (first node repeated at the end) or None
+    # the walk carries on past a cycle without following the edge that closes it, so heights covers
+    # every node reachable from start
+    cycle = None
+    heights = {}
+    path, on_path = [start], {start}
+    stack = [(start, iter(graph.get(start, ())))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child in on_path:
+                if cycle is None:
+                    cycle = path[path.index(child):] + [child]
+                continue
+            if child not in heights:
+                stack.append((child, iter(graph.get(child, ()))))
+                path.append(child)
+                on_path.add(child)
+                break
+        else:
+            stack.pop()
+            path.pop()
+            on_path.discard(node)
+            # a child still on the path closes a cycle, it adds nothing to the height
+            heights[node] = 1 + max((heights.get(child, 0) for child in graph.get(node, ())), default=0)
+    return cycle, heights
+
+
+def check_submenus(menu_key, submenu_keys, graph=None):
+    # check the graph with menu_key loading submenu_keys in place of its saved submenus
+    # keys are translation keys (see above), graph defaults to the saved submenu graph
+    # the submenus given stand in for those of all the menu's translations, which are synchronised
+    # from the source menu anyway
+    # returns (cycle, depth): cycle is the list of keys going round a cycle anywhere in the trees
+    # containing menu_key - below it or in the menus that load it (first key repeated at the end),
+    # None if there isn't one
+    # depth is the most levels any tree containing menu_key would have, leaving out the edges that
+    # close cycles (a menu on a cycle through menu_key can be counted going down and going up)
+    # linear in the size of the graph
+    graph = dict(get_submenu_graph() if graph is None else graph)
+    graph[menu_key] = set(submenu_keys)
+
+    # levels of menu_key's own tree
+    cycle, heights = longest_paths(graph, menu_key)
+
+    # levels above it in the deepest tree that loads it
+    parents = {}
+    for parent, children in graph.items():
+        for child in children:
+            parents.setdefault(child, set()).add(parent)
+    cycle_above, levels_above = longest_paths(parents, menu_key)
+    if cycle is None and cycle_above is not None:
+        cycle = list(reversed(cycle_above))
+    return cycle, heights[menu_key] + levels_above[menu_key] - 1
@@ -1,37 +1,66 @@
-from menu.models import Menu, CompanyLogo
+import logging
+import re
+
+from menu.cache import (MENU_CACHE_TIMEOUT, get_compiled_menu, get_compiled_menus,
+                        get_menu_generation, menu_fragment_key)
+from menu.company_logo import get_company_logo
+from menu.flags import get_flag, get_flags
+from menu.hreflang import get_alternates
+from menu.instrumentation import instrument_tag
+from menu.loaders import load_menu_items, localize_menus
+from menu.locales import get_active_locale, get_locales
+from menu.models import Menu
+from menu.submenu_graph import MENU_MAX_DEPTH
 from django import template
-from wagtail_localize.synctree import Locale
-from wagtail.images.models import Image
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+from wagtail_localize.synctree import Page
+
+logger = logging.getLogger(__name__)
+
+# render_menu caches html that doesn't depend on the request path - menu_active_marker leaves
+# the item url between these control characters (which can't occur in escaped html) and the
+# markers are swapped for ' active' or '' once the fragment is fetched
+ACTIVE_MARKER_START = '\x02'
+ACTIVE_MARKER_END = '\x03'
+ACTIVE_MARKER = re.compile(f'{ACTIVE_MARKER_START}(.*?){ACTIVE_MARKER_END}', re.DOTALL)
 
-def sub_menu_items(menu, logged_in):
-    # return any submenus for the menu instance
+def sub_menu_items(items, logged_in):
+    # return any submenus from the loaded submenu items
+    # menu_id, title and icon are from the submenu in the active locale (menu_id is None if it doesn't exist)
     sub_menu_items = []
-    for item in menu.sub_menu_items.all():
+    for item in items:
         if item.show(logged_in):
+            submenu = item.localized_submenu
             sub_menu_items.append({
                 'order': item.menu_display_order,
                 'submenu_id': item.submenu_id, 
+                'menu_id': submenu.id if submenu else None,
+                'title': submenu.title if submenu else None,
+                'icon': submenu.icon if submenu else None,
                 'is_submenu': True,
                 'divider': item.show_divider_after_this_item,
                 'display_option': item.display_option,
             })
     return sub_menu_items
 
-def link_menu_items(menu, logged_in):
-    #return any links for the menu instance
+def link_menu_items(items, logged_in, page_urls):
+    #return any links from the loaded link items
     link_menu_items = []
-    for item in menu.link_menu_items.all():
+    for item in items:
         if item.show(logged_in): # authentication status of user matches item 'show_when' property
             if item.link_page: # link is to internal page (not url)
-                trans_page = item.link_page.localized # get translated page if any
+                trans_page = item.localized_page # translated page if any, resolved by the loader
                 if not item.title: # no title set in menu item, use page title
                     item.title = trans_page.title
-                url = str(trans_page.url)
+                url = str(page_urls[trans_page.id])
                 if item.link_url: # anything in url field to be treated as suffix (eg /?cat=news)
                     url = url + str(item.link_url)
             else: # not a page link, test if internal or external url, translate if internal
                 if item.link_url.startswith('/'): # presumes internal link starts with '/' and no lang code
-                    url = '/' + Locale.get_active().language_code + item.link_url
+                    url = '/' + get_active_locale().language_code + item.link_url
                 else: # external link, do nothing
                     url = item.link_url                
             link_menu_items.append({
@@ -44,30 +73,22 @@ def link_menu_items(menu, logged_in):
             })
     return link_menu_items
 
-def autofill_menu_items(menu, logged_in):
+def autofill_menu_items(items, logged_in, page_urls):
     autofill_menu_items = []
-    for item in menu.autofill_menu_items.all():
+    for item in items:
         if item.show(logged_in): # authentication status of user matches item 'show_when' property
-            trans_page = item.link_page.localized # get translated page if any
+            trans_page = item.localized_page # translated page if any, resolved by the loader
             if trans_page:
                 if item.include_linked_page: # show linked page as well as any results
                     autofill_menu_items.append({
                         'order': item.menu_display_order,
                         'title': trans_page.title, 
-                        'url': trans_page.url,
+                        'url': page_urls[trans_page.id],
                         'is_submenu': False,
                         'divider': True,
                     })
-                # return only public pages if user not logged in
-                if logged_in:
-                    list = trans_page.get_children().live().order_by(item.order_by)
-                else:
-                    list = trans_page.get_children().live().public().order_by(item.order_by)
-                # filter by 'Show In Menu' if selected
-                if item.only_show_in_menus:
-                    list = list.filter(show_in_menus=True)
-                # limit list to maximum set in menu item
-                list = list[:item.max_items]
+                # live (and public if user not logged in) children, resolved by the loader
+                list = item.autofill_pages
                 # add results (if any) to menu items
                 if list:
                     i = 0
@@ -75,7 +96,7 @@ def autofill_menu_items(menu, logged_in):
                         autofill_menu_items.append({
                             'order': item.menu_display_order + i/(item.max_items + 1),
                             'title': result.title, 
-                            'url': result.url,
+                            'url': page_urls[result.id],
                             'is_submenu': False,                            
                         })
                         i+=1
@@ -83,12 +104,73 @@ def autofill_menu_items(menu, logged_in):
                     autofill_menu_items[-1]['divider'] = item.show_divider_after_this_item
     return autofill_menu_items
 
+def build_menu_items(menu_ids, authenticated):
+    # load all menu item types for all the menus in one pass, sort by menu_display_order at the end
+    # create a list for each menu of all items that should be shown depending on logged_in
+    compiled = {}
+    for menu_id, items in load_menu_items(menu_ids, get_active_locale(), authenticated).items():
+        menu_items = [] + \
+                     sub_menu_items(items.sub_menu_items, authenticated) + \
+                     link_menu_items(items.link_menu_items, authenticated, items.page_urls) + \
+                     autofill_menu_items(items.autofill_menu_items, authenticated, items.page_urls)
+
+        # sort menu items by common 'order' field
+        compiled[menu_id] = sorted(menu_items, key=lambda k: k['order'])
+    return compiled
+
+def prune_menu_tree(menu_items):
+    # drop submenus with nothing to show, working up from the deepest level
+    pruned = []
+    for item in menu_items:
+        if item['is_submenu']:
+            item['children'] = prune_menu_tree(item['children'])
+            if not item['children']:
+                continue
+        pruned.append(item)
+    return pruned
+
+def build_menu_tree(menu, language_code, authenticated, max_depth):
+    # nest the compiled items of each submenu under its submenu item as 'children'
+    # works a level at a time so each level is one cache lookup (and one build for any misses)
+    # a submenu that is already one of its own ancestors is a cycle and is left out, as are
+    # submenus deeper than max_depth (the top level menu is depth 1)
+    generation = get_menu_generation()
+    root = {'menu_id': menu.id}
+    level = [(root, (menu.id,))]
+    depth = 1
+    while level:
+        compiled = get_compiled_menus(
+            {node['menu_id'] for node, ancestors in level}, language_code, authenticated,
+            build_menu_items, generation
+        )
+        next_level = []
+        for node, ancestors in level:
+            node['children'] = []
+            for item in compiled[node['menu_id']]:
+                item = dict(item)
+                if item['is_submenu']:
+                    if item['menu_id'] is None or depth >= max_depth:
+                        continue
+                    if item['menu_id'] in ancestors:
+                        logger.warning(
+                            "Submenu cycle: menu %s loads menu %s which is one of its parents, submenu skipped",
+                            ancestors[-1], item['menu_id']
+                        )
+                        continue
+                    next_level.append((item, ancestors + (item['menu_id'],)))
+                node['children'].append(item)
+        level = next_level
+        depth += 1
+    return prune_menu_tree(root['children'])
+
 register = template.Library()
 
 @register.simple_tag()
+@instrument_tag
 def get_menu_items(menu, request):
     # returns a list of dictionaries with title, url, page and icon of all items in the menu
     # use get_menu first to load the menu object then pass that instance to this function
+    # the list is compiled once per menu, active locale and authentication state and cached
 
     authenticated = request.user.is_authenticated
 
@@ -99,63 +181,145 @@ def get_menu_items(menu, request):
         if menu == None:
             # couldn't load menu, return nothing
             return None
-    
-    # gather all menu item types, sort by menu_display_order at the end
-    # create a list of all items that should be shown in the menu depending on logged_in
-    menu_items = [] + \
-                 sub_menu_items(menu, authenticated) + \
-                 link_menu_items(menu, authenticated) + \
-                 autofill_menu_items(menu, authenticated)
+
+    menu_items = get_compiled_menu(
+        menu, get_active_locale().language_code, authenticated, build_menu_items
+    )
 
     # if no menu items to show, return None
     if menu_items.__len__() == 0:
         return None
 
-    # sort menu items by common 'order' field
-    menu_items = sorted(menu_items, key=lambda k: k['order'])
-
     return menu_items
 
 @register.simple_tag()
+@instrument_tag
+def get_menu_tree(menu, request, max_depth=MENU_MAX_DEPTH):
+    # returns the same list as get_menu_items with each submenu item holding its own items in 'children'
+    # down to max_depth levels, submenus that are empty, missing or part of a cycle are left out
+    # iterate the result recursively in the template rather than calling get_menu for each submenu
+
+    authenticated = request.user.is_authenticated
+
+    if not isinstance(menu, Menu):
+        if isinstance(menu, int):
+            # menu id supplied instead of menu instance
+            menu = get_menu(menu)
+        if menu == None:
+            # couldn't load menu, return nothing
+            return None
+
+    menu_tree = build_menu_tree(menu, get_active_locale().language_code, authenticated, max_depth)
+
+    # if no menu items to show, return None
+    if not menu_tree:
+        return None
+
+    return menu_tree
+
+def mark_active(html, path):
+    # swap the active markers for the ' active' class where the item url is the current path
+    path = escape(path)
+    return ACTIVE_MARKER.sub(lambda match: ' active' if match.group(1) == path else '', html)
+
+@register.simple_tag()
+def menu_active_marker(url):
+    # use in templates rendered by render_menu in place of {% if request.path == item.url %} active{% endif %}
+    return format_html('{}{}{}', mark_safe(ACTIVE_MARKER_START), url, mark_safe(ACTIVE_MARKER_END))
+
+@register.simple_tag(takes_context=True)
+@instrument_tag
+def render_menu(context, menu, template_name='menus/main_menu_items.html', max_depth=MENU_MAX_DEPTH):
+    # render the menu tree with template_name (given the tree as 'navigation') and cache the html
+    # one fragment per menu, locale, authentication state and menu generation so the same html
+    # serves every page - the active item is marked after it comes out of the cache
+    # the template must not use the request, use menu_active_marker for the active class
+    request = context['request']
+    authenticated = request.user.is_authenticated
+
+    if not isinstance(menu, Menu):
+        menu = get_menu(menu)
+        if menu == None:
+            return ''
+
+    language_code = get_active_locale().language_code
+    key = menu_fragment_key(menu.id, language_code, authenticated, template_name, max_depth)
+
+    html = cache.get(key)
+    if html is None:
+        menu_tree = build_menu_tree(menu, language_code, authenticated, max_depth)
+        html = render_to_string(template_name, {'navigation': menu_tree})
+        cache.set(key, html, MENU_CACHE_TIMEOUT)
+
+    return mark_safe(mark_active(html, request.path))
+
+@register.simple_tag()
+@instrument_tag
 def get_menu(menu_id):
     # return the localized menu instance for a given id, or none if no such menu exists
-    try:
-        return Menu.objects.get(id=menu_id).localized
-    except (AttributeError, Menu.DoesNotExist):
-        return None
+    return localize_menus([menu_id], get_active_locale()).get(menu_id)
     
 @register.simple_tag()
+@instrument_tag
 def language_switcher(page):
     # Build the language switcher, including the href alternate links for SEO
-    default_lang = Locale.get_default()
-    current_lang = Locale.get_active()
+    # the urls of all live translations of the page come from the hreflang table (one indexed lookup),
+    # the flags from the flag registry
+    # a locale without a live translation switches to the page in the default language if there is one,
+    # otherwise to its home page, and gets no alternate link
+    # page can be anything (eg the search view passes a string), only the language is switched then
+    locales = get_locales()
+    current_lang = get_active_locale()
+
+    alternates = get_alternates(page.translation_key) if isinstance(page, Page) else {}
+    default_alternate = alternates.get('x-default')
+    flags = get_flags()
 
     switch_pages = []
-    for locale in Locale.objects.all():
+    for locale in locales:
         if not locale == current_lang: # add the link to switch language and also alternate link
-            trans_page = page.get_translation(locale=locale)
-            alternate_link = f'<link rel="alternate" hreflang="{locale.language_code}" href="{trans_page.get_full_url()}" />'
+            alternate = alternates.get(locale.language_code)
+            if alternate:
+                url = '/lang/' + locale.language_code + '/?next=' + alternate.url
+                alternate_link = format_html(
+                    '<link rel="alternate" hreflang="{}" href="{}" />', locale.language_code, alternate.full_url
+                )
+            elif alternates:
+                # no translation, fall back to the default language version or the home page
+                next_url = default_alternate.url if default_alternate else '/' + locale.language_code + '/'
+                url = '/lang/' + locale.language_code + '/?next=' + next_url
+                alternate_link = ''
+            else:
+                # not a page, set_language_from_url translates the referring url
+                url = '/lang/' + locale.language_code + '/'
+                alternate_link = ''
             switch_pages.append(
                 {
                     'language': locale, 
-                    'url': '/lang/' + locale.language_code + '/?next=' + trans_page.url,
-                    'flag': get_lang_flag(locale.language_code),
+                    'url': url,
+                    'flag': flags.get(locale.language_code),
                     'alternate': alternate_link
                 }
             )
-        if locale == default_lang: # add the x-default link
-            default_link = f'<link rel="alternate" hreflang="x-default" href="{trans_page.get_full_url()}" />'
+
+    # add the x-default link, the page in the default language
+    default_link = format_html(
+        '<link rel="alternate" hreflang="x-default" href="{}" />', default_alternate.full_url
+    ) if default_alternate else ''
     return {'switch_pages':switch_pages, 'default_link': default_link}
 
 @register.simple_tag()
+@instrument_tag
 def get_lang_flag(language_code=None):
-    # returns the flag icon for the menu 
+    # returns the flag icon rendition for the menu, render with <img{{ flag.attrs }}>
     # upload flag image to wagtail, set title to flag-lang (eg flag-fr, flag-en)
     # if no language code supplied, assumes current language
     if not language_code:
-        language_code = Locale.get_active().language_code
-    return Image.objects.all().filter(title='flag-' + language_code).first()
+        language_code = get_active_locale().language_code
+    return get_flag(language_code)
 
 @register.simple_tag()
+@instrument_tag
 def company_logo():
-    return CompanyLogo.objects.first()
+    # the company logo snippet, cached with its renditions - menus/main_menu.html renders logo.rendition
+    return get_company_logo()
@@ -1,3 +1,361 @@
-from django.test import TestCase
+import uuid
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone, translation
+from wagtail.core.models import PageViewRestriction, Site
+from wagtail_localize.synctree import Locale, Page
+
+from .cache import bump_menu_generation
+from .hreflang import get_translation_url
+from .loaders import load_autofill_pages
+from .locales import locale_registry
+from .models import AutofillMenuItem, LinkMenuItem, Menu
+from .page_urls import get_page_urls
+from .templatetags import menu_tags
+from .submenu_graph import check_submenus, longest_paths
+
+
+class LongestPathsTests(SimpleTestCase):
+
+    def test_tree(self):
+        graph = {1: {2, 3}, 2: {4}, 4: {5}}
+        cycle, heights = longest_paths(graph, 1)
+        self.assertIsNone(cycle)
+        self.assertEqual(heights, {1: 4, 2: 3, 3: 1, 4: 2, 5: 1})
+
+    def test_shared_submenu_walked_once(self):
+        graph = {1: {2, 3}, 2: {4}, 3: {4}, 4: {5}}
+        cycle, heights = longest_paths(graph, 1)
+        self.assertIsNone(cycle)
+        self.assertEqual(heights[1], 4)
+
+    def test_cycle(self):
+        cycle, heights = longest_paths({1: {2}, 2: {3}, 3: {1}}, 1)
+        self.assertEqual(cycle, [1, 2, 3, 1])
+        # the edge closing the cycle is skipped, every node still gets a height
+        self.assertEqual(heights, {1: 3, 2: 2, 3: 1})
+
+    def test_walk_continues_past_cycle(self):
+        graph = {1: {2, 5}, 2: {2}, 5: {6}, 6: {7}}
+        cycle, heights = longest_paths(graph, 1)
+        self.assertEqual(cycle, [2, 2])
+        self.assertEqual(heights[1], 4)
+
+    def test_start_not_in_graph(self):
+        self.assertEqual(longest_paths({}, 1), (None, {1: 1}))
+
+
+class CheckSubmenusTests(SimpleTestCase):
+
+    def test_depth_below_and_above(self):
+        # 1 -> 2 -> (3 -> 4 saved here)
+        graph = {1: {2}, 2: {3}}
+        self.assertEqual(check_submenus(3, {4}, graph), (None, 4))
+        self.assertEqual(check_submenus(4, set(), graph), (None, 1))
+
+    def test_replaces_saved_submenus(self):
+        graph = {1: {2}, 2: {3}, 3: {4}}
+        self.assertEqual(check_submenus(2, set(), graph), (None, 2))
+
+    def test_new_menu(self):
+        self.assertEqual(check_submenus('new', {1}, {1: {2}}), (None, 3))
+
+    def test_cycle_through_menu(self):
+        cycle = check_submenus(3, {1}, {1: {2}, 2: {3}})[0]
+        self.assertEqual(cycle, [3, 1, 2, 3])
+
+    def test_cycle_above_menu(self):
+        # the loop between 1 and 2 doesn't involve the submenus saved here, it is still reported
+        # and the depth is still checked
+        graph = {1: {2}, 2: {1, 5}, 6: {7}, 7: {8}}
+        cycle, depth = check_submenus(5, {6}, graph)
+        self.assertEqual(cycle, [2, 1, 2])
+        self.assertEqual(depth, 6)
+
+    def test_does_not_change_graph(self):
+        graph = {1: {2}}
+        check_submenus(1, {3}, graph)
+        self.assertEqual(graph, {1: {2}})
+
+
+class AutofillPagesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # two parents so the window has more than one partition, children with every combination
+        # of live / show in menus / private and a grandchild that must never be listed
+        root = Page.get_first_root_node()
+        published = timezone.make_aware(datetime(2020, 1, 1))
+        cls.parents = []
+        for p in range(2):
+            parent = root.add_child(instance=Page(title=f'Parent {p}', slug=f'parent-{p}'))
+            for c in range(12):
+                child = parent.add_child(instance=Page(
+                    title=f'Child {p}.{c}', slug=f'child-{p}-{c}',
+                    live=c % 5 != 4, show_in_menus=c % 3 == 0,
+                    first_published_at=published + timedelta(days=(c * 7) % 12),
+                    last_published_at=published + timedelta(days=(c * 5) % 12),
+                ))
+                if c == 6:
+                    PageViewRestriction.objects.create(page=child, restriction_type=PageViewRestriction.LOGIN)
+                    child.add_child(instance=Page(title=f'Grandchild {p}', slug=f'grandchild-{p}'))
+            cls.parents.append(parent)
+
+    def make_items(self, max_items):
+        # the window keeps as many rows per parent as the largest max_items in a load, so each
+        # max_items is loaded on its own to have the window cut the rows
+        items = []
+        for parent in self.parents:
+            for order_by in ('-first_published_at', 'first_published_at', '-last_published_at'):
+                for only_show_in_menus in (False, True):
+                    item = AutofillMenuItem(
+                        link_page=parent, order_by=order_by, max_items=max_items,
+                        only_show_in_menus=only_show_in_menus,
+                    )
+                    item.localized_page = parent
+                    items.append(item)
+        return items
+
+    def expected(self, item, authenticated):
+        # the query the menu tag ran per item before the pages were loaded in bulk
+        pages = item.link_page.get_children().live()
+        if not authenticated:
+            pages = pages.public()
+        if item.only_show_in_menus:
+            pages = pages.filter(show_in_menus=True)
+        return list(pages.order_by(item.order_by, 'path')[:item.max_items].values_list('id', flat=True))
+
+    def check_items(self):
+        for authenticated in (True, False):
+            for max_items in (0, 1, 3, 20):
+                items = self.make_items(max_items)
+                load_autofill_pages(items, authenticated)
+                for item in items:
+                    with self.subTest(authenticated=authenticated, parent=item.link_page.title,
+                                      order_by=item.order_by, max_items=max_items,
+                                      only_show_in_menus=item.only_show_in_menus):
+                        self.assertEqual(
+                            [page.id for page in item.autofill_pages], self.expected(item, authenticated)
+                        )
+
+    def test_windowed(self):
+        if not connection.features.supports_over_clause:
+            self.skipTest("database has no window functions")
+        self.check_items()
+
+    def test_without_window_functions(self):
+        with mock.patch.object(connection.features, 'supports_over_clause', False):
+            self.check_items()
+
+
+class PageUrlsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        site = Site.objects.get(is_default_site=True)
+        cls.hostname = site.hostname
+        parent = site.root_page.add_child(instance=Page(title='Parent', slug='parent'))
+        child = parent.add_child(instance=Page(title='Café', slug='café'))
+        # outside every site, not routable
+        orphan = Page.get_first_root_node().add_child(instance=Page(title='Orphan', slug='orphan'))
+        cls.pages = [site.root_page, parent, child, orphan]
+
+    def check_urls(self):
+        request = RequestFactory().get('/', SERVER_NAME=self.hostname)
+        pages = [Page.objects.get(id=page.id) for page in self.pages]
+        self.assertEqual(get_page_urls(pages, request), {page.id: page.get_url(request) for page in pages})
+        self.assertEqual(
+            get_page_urls(pages, request, full=True), {page.id: page.get_full_url(request) for page in pages}
+        )
+        self.assertEqual(get_page_urls(pages), {page.id: page.get_url() for page in pages})
+
+    def test_same_as_page_urls(self):
+        # en-gb is the active variant of the en content language, fr is a content language itself
+        for language_code in ('en-gb', 'fr'):
+            with self.subTest(language_code=language_code), translation.override(language_code):
+                self.check_urls()
+
+    @override_settings(WAGTAIL_I18N_ENABLED=False)
+    def test_same_as_page_urls_without_i18n(self):
+        for language_code in ('en-gb', 'fr'):
+            with self.subTest(language_code=language_code), translation.override(language_code):
+                self.check_urls()
+
+
+class MenuJsonTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu = Menu.objects.create(title='Main', locale=Locale.get_default())
+        LinkMenuItem.objects.create(menu=cls.menu, locale=cls.menu.locale, title='Link', link_url='/link/')
+        cls.url = f'/en/menus/{cls.menu.id}/'
+
+    def test_json(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['id'], data['title']), (self.menu.id, 'Main'))
+        self.assertEqual([item['title'] for item in data['items']], ['Link'])
+        self.assertEqual(self.client.get('/en/menus/999999/').status_code, 404)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_not_modified_any_etag(self):
+        # * only matches a menu that exists
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='*').status_code, 304)
+        self.assertEqual(self.client.get('/en/menus/999999/', HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+    def test_etag_changes_with_generation(self):
+        etag = self.client.get(self.url)['ETag']
+        bump_menu_generation()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_control(self):
+        response = self.client.get(self.url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        self.client.force_login(get_user_model().objects.create_user('menu-json'))
+        response = self.client.get(self.url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+
+class RenderMenuTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu = Menu.objects.create(title='Main', locale=Locale.get_default())
+        for order, link_url in enumerate(['/first/', '/second/', "/o'brien/"]):
+            LinkMenuItem.objects.create(
+                menu=cls.menu, locale=cls.menu.locale, title=f'Link {order}', link_url=link_url,
+                menu_display_order=order,
+            )
+
+    def render(self, path):
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        with translation.override('en'):
+            return Template('{% load menu_tags %}{% render_menu menu %}').render(
+                Context({'request': request, 'menu': self.menu.id})
+            )
+
+    def active_items(self, html):
+        return [line for line in html.splitlines() if 'nav-item active' in line]
+
+    def test_fragment_reused_and_active_item_marked(self):
+        with mock.patch.object(menu_tags, 'build_menu_tree', wraps=menu_tags.build_menu_tree) as build:
+            first = self.render('/en/first/')
+            second = self.render('/en/second/')
+            other = self.render('/en/elsewhere/')
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(len(self.active_items(first)), 1)
+        self.assertEqual(len(self.active_items(second)), 1)
+        self.assertEqual(self.active_items(other), [])
+        # the same html apart from the active class, no markers left in it
+        self.assertEqual(first.replace(' active', ''), second.replace(' active', ''))
+        self.assertEqual(first.replace(' active', ''), other)
+        for html in (first, second, other):
+            self.assertNotIn(menu_tags.ACTIVE_MARKER_START, html)
+            self.assertNotIn(menu_tags.ACTIVE_MARKER_END, html)
+        self.assertIn('href="/en/first/"', first.split('nav-item active', 1)[1].split('</li>', 1)[0])
+
+    def test_escaped_url_matches(self):
+        html = self.render("/en/o'brien/")
+        self.assertEqual(len(self.active_items(html)), 1)
+        self.assertIn('href="/en/o&#x27;brien/"', html.split('nav-item active', 1)[1].split('</li>', 1)[0])
+
+    def test_fragment_rebuilt_after_generation_bump(self):
+        with mock.patch.object(menu_tags, 'build_menu_tree', wraps=menu_tags.build_menu_tree) as build:
+            self.render('/en/first/')
+            self.render('/en/first/')
+            bump_menu_generation()
+            self.render('/en/first/')
+        self.assertEqual(build.call_count, 2)
+
+
+class TranslationFallbackTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # en and fr sites with a page translated into both and a page only in english
+        # es has no pages at all
+        cls.en = Locale.get_default()
+        cls.fr = Locale.objects.create(language_code='fr')
+        Locale.objects.create(language_code='es')
+        site = Site.objects.get(is_default_site=True)
+        home_fr = Page.get_first_root_node().add_child(instance=Page(
+            title='Accueil', slug='accueil', locale=cls.fr, translation_key=site.root_page.translation_key,
+        ))
+        cls.about = site.root_page.add_child(instance=Page(title='About', slug='about'))
+        home_fr.add_child(instance=Page(
+            title='A propos', slug='a-propos', locale=cls.fr, translation_key=cls.about.translation_key,
+        ))
+        cls.only_en = site.root_page.add_child(instance=Page(title='Only', slug='only'))
+
+    def setUp(self):
+        # the signals would do this on commit, test cases never commit
+        locale_registry.bump()
+        cache.delete('wagtail_site_root_paths')
+
+    def test_translation_url(self):
+        key = self.about.translation_key
+        self.assertEqual(get_translation_url(key, 'fr'), '/fr/a-propos/')
+        self.assertEqual(get_translation_url(key, 'en'), '/en/about/')
+
+    def test_falls_back_to_default_language_page(self):
+        self.assertEqual(get_translation_url(self.about.translation_key, 'es'), '/en/about/')
+        self.assertEqual(get_translation_url(self.only_en.translation_key, 'fr'), '/en/only/')
+
+    def test_falls_back_to_home_page(self):
+        # no live page with the translation key, or a language with no locale
+        self.assertEqual(get_translation_url(uuid.uuid4(), 'fr'), '/')
+        self.assertEqual(get_translation_url(self.about.translation_key, 'xx'), '/')
+
+    def test_locale_added_after_map_cached(self):
+        key = self.about.translation_key
+        self.assertEqual(get_translation_url(key, 'fr'), '/fr/a-propos/')
+        Locale.objects.create(language_code='ca')
+        locale_registry.bump()
+        self.assertEqual(get_translation_url(key, 'ca'), '/en/about/')
+
+    def switcher(self, page):
+        with translation.override('en'):
+            switcher = menu_tags.language_switcher(page)
+        return switcher, {lang['language'].language_code: lang for lang in switcher['switch_pages']}
+
+    def test_language_switcher(self):
+        switcher, languages = self.switcher(self.about)
+        self.assertEqual(sorted(languages), ['es', 'fr'])
+        self.assertEqual(languages['fr']['url'], '/lang/fr/?next=/fr/a-propos/')
+        self.assertIn('hreflang="fr"', languages['fr']['alternate'])
+        self.assertIn('/fr/a-propos/"', languages['fr']['alternate'])
+        # no translation: the page in the default language, and no alternate link
+        self.assertEqual(languages['es']['url'], '/lang/es/?next=/en/about/')
+        self.assertEqual(languages['es']['alternate'], '')
+        self.assertIn('hreflang="x-default"', switcher['default_link'])
+        self.assertIn('/en/about/"', switcher['default_link'])
+
+    def test_language_switcher_not_a_page(self):
+        # eg the search view, the language is switched on the referring url
+        switcher, languages = self.switcher('search')
+        self.assertEqual(languages['fr']['url'], '/lang/fr/')
+        self.assertEqual(languages['fr']['alternate'], '')
+        self.assertEqual(switcher['default_link'], '')
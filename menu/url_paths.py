@@ -0,0 +1,30 @@
+from wagtail_localize.synctree import Page
+
+from .cache import VersionedRegistry
+
+# url_path -> (page id, translation_key) for every page, so set_language_from_url can find the
+# referring page without a text match on the unindexed wagtailcore_page.url_path column.
+# Built in one query. A VersionedRegistry, bumped when a page is created, published, moved or
+# deleted (menu.signals).
+URL_PATH_INDEX_VERSION_KEY = 'url-path-index-version'
+
+
+def load_url_path_index():
+    return {
+        url_path: (page_id, translation_key)
+        for url_path, page_id, translation_key
+        in Page.objects.values_list('url_path', 'id', 'translation_key').iterator()
+    }
+
+
+url_path_index = VersionedRegistry(URL_PATH_INDEX_VERSION_KEY, load_url_path_index)
+
+
+def get_url_path_index():
+    # the index, rebuilt if a page has changed since it was built
+    return url_path_index.get()
+
+
+def find_page(url_path):
+    # (page id, translation_key) of the page with the url_path, None if there isn't one
+    return get_url_path_index().get(url_path)
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('<int:menu_id>/', views.menu_json, name='menu_json'),
+]
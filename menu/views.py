@@ -1,18 +1,39 @@
+import json
+from itertools import groupby
+
 from django import urls
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
 from django.utils import translation
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from django.template.response import TemplateResponse
+from django.views.decorators.http import require_GET
 from urllib.parse import urlparse
-from wagtail_localize.synctree import Page as LocalizePage, Locale
+from wagtail.images.shortcuts import get_rendition_or_not_found
+from wagtail_localize.synctree import Page as LocalizePage
+
+from .cache import MENU_CACHE_TIMEOUT, menu_version
+from .hreflang import fill_missing_alternates, get_translation_url
+from .locales import get_active_locale, get_locale_by_code
+from .models import HreflangAlternate, Menu
+from .url_paths import find_page
+from .templatetags.menu_tags import MENU_MAX_DEPTH, build_menu_tree, get_menu
+
+# browsers and shared caches may keep an anonymous menu this long before revalidating
+MENU_API_MAX_AGE = getattr(settings, 'MENU_API_MAX_AGE', 60 * 5)
+# rendition of the item icons included in the menu api
+MENU_API_ICON_FILTER = getattr(settings, 'MENU_API_ICON_FILTER', 'fill-25x25')
+# menus per page of the submenu chooser
+SUBMENU_CHOOSER_PAGE_SIZE = getattr(settings, 'SUBMENU_CHOOSER_PAGE_SIZE', 20)
 
 def set_language_from_url(request, language_code):
     # call url with ?next=<<translated url>> to redirect to translated page
     # if no next url supplied, will attempt to find it from referring url
     # if fails that, will send to home page of the language_code
     # if requested language is not a registered locale, send to home page
-    try:
-        requested_locale = Locale.objects.get(language_code=language_code)
-    except Locale.DoesNotExist:
+    if get_locale_by_code(language_code) is None:
         return HttpResponseRedirect('/')
 
     next_url = request.GET.get("next", None)
@@ -31,21 +52,18 @@ def set_language_from_url(request, language_code):
                 # wagtail-localize uses a different root in the actual path for each language in wagtailcore_page
                 # (lang1 -> home, lang2 -> home-1, lang3 -> home-3 etc)
                 # Matching the slug to lang code means lang1->lang1 etc, the path is valid url_path
-                prev_page = LocalizePage.objects.get(url_path=prev_path)
+                # The page is found from the cached url_path index rather than the unindexed url_path column
+                prev_page = find_page(prev_path)
+                if prev_page == None:
+                    raise LocalizePage.DoesNotExist
 
                 # Get the url of page in requested language
                 # If that doesn't exist, get url of page in default language
                 # If the page doesn't exist in the default language, default to home page
-                next_page = prev_page.get_translation_or_none(locale=requested_locale)
-                if next_page == None:
-                    default_locale = Locale.objects.get(language_code=settings.LANGUAGES[0][0])
-                    next_page = prev_page.get_translation_or_none(locale=default_locale)
-                if next_page != None:
-                    next_url = next_page.url
-                else:
-                    next_url = '/'
-
-            except (LocalizePage.DoesNotExist, Locale.DoesNotExist):
+                # All precomputed in the translation redirect map kept with the hreflang table
+                next_url = get_translation_url(prev_page[1], language_code)
+
+            except LocalizePage.DoesNotExist:
                 # previous page is not a LocalizePage, try if previous path can be translated by 
                 # changing the language code
                 next_url = urls.translate_url(previous, language_code)
@@ -66,3 +84,139 @@ def set_language_from_url(request, language_code):
     response.set_cookie(settings.LANGUAGE_COOKIE_NAME, language_code, max_age=60*60*24*365)
 
     return response
+
+def serialize_menu_icon(image):
+    # icon as json - the rendition the navbar uses plus the original image id and title
+    # a missing source file gives the not-found rendition, as the navbar's image tag does
+    if not image:
+        return None
+    rendition = get_rendition_or_not_found(image, MENU_API_ICON_FILTER)
+    return {
+        'id': image.id,
+        'title': image.title,
+        'url': rendition.url,
+        'width': rendition.width,
+        'height': rendition.height,
+    }
+
+def serialize_menu_items(menu_items):
+    # the get_menu_tree structure as json, submenus nested under 'children'
+    serialized = []
+    for item in menu_items:
+        data = {
+            'title': item['title'],
+            'icon': serialize_menu_icon(item.get('icon')),
+            'is_submenu': item['is_submenu'],
+            'divider': bool(item.get('divider')),
+        }
+        if item['is_submenu']:
+            data['menu_id'] = item['menu_id']
+            data['display_option'] = item['display_option']
+            data['children'] = serialize_menu_items(item['children'])
+        else:
+            data['url'] = item['url']
+        serialized.append(data)
+    return serialized
+
+def etag_matches(request, etag, exists=False):
+    # the client already has this version of the menu
+    # If-None-Match: * matches any version, so only once the menu is known to exist
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return etag in if_none_match or (exists and '*' in if_none_match)
+
+def menu_response(request, etag, body, authenticated):
+    # 304 if the client has this version already, otherwise the json
+    # only called for a menu that exists
+    if etag_matches(request, etag, exists=True):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=MENU_API_MAX_AGE)
+    # the same url gives a different menu once logged in
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+@require_GET
+def menu_json(request, menu_id):
+    # the menu in the active locale as json, as get_menu_tree builds it for the navbar
+    # the strong ETag is derived from the menu generation, so a matching If-None-Match
+    # gets a 304 from a single cache read (no menu queries)
+    # anonymous responses may be cached publicly for MENU_API_MAX_AGE, authenticated ones are
+    # private and revalidated every time
+    authenticated = request.user.is_authenticated
+    language_code = get_active_locale().language_code
+    version = menu_version(menu_id, language_code, authenticated, MENU_MAX_DEPTH)
+    etag = quote_etag(version)
+    if etag_matches(request, etag):
+        return menu_response(request, etag, None, authenticated)
+
+    body = cache.get(f'menu-json:{version}')
+    if body is None:
+        menu = get_menu(menu_id)
+        if menu is None:
+            raise Http404
+        menu_tree = build_menu_tree(menu, language_code, authenticated, MENU_MAX_DEPTH)
+        body = json.dumps({
+            'id': menu.id,
+            'title': menu.title,
+            'icon': serialize_menu_icon(menu.icon),
+            'items': serialize_menu_items(menu_tree),
+        })
+        cache.set(f'menu-json:{version}', body, MENU_CACHE_TIMEOUT)
+    return menu_response(request, etag, body, authenticated)
+
+@require_GET
+def sitemap(request):
+    # sitemap of every live public page with its hreflang alternates, read from the hreflang table
+    # pages that have never had their alternates written are written first (not those written empty)
+    missing = LocalizePage.objects.live().filter(depth__gt=1).exclude(
+        translation_key__in=HreflangAlternate.objects.values('translation_key')
+    ).values_list('translation_key', flat=True)
+    fill_missing_alternates(missing)
+
+    rows = HreflangAlternate.objects.filter(page__in=LocalizePage.objects.live().public()) \
+        .select_related('page').order_by('translation_key', 'hreflang')
+    urlset = []
+    for translation_key, alternates in groupby(rows, key=lambda row: row.translation_key):
+        alternates = list(alternates)
+        for alternate in alternates:
+            if alternate.hreflang != 'x-default':
+                urlset.append({
+                    'location': alternate.full_url,
+                    'lastmod': alternate.page.last_published_at,
+                    'alternates': alternates,
+                })
+    return TemplateResponse(request, 'sitemap.xml', {'urlset': urlset}, content_type='application/xml')
+
+@require_GET
+def submenu_chooser(request):
+    # admin endpoint for the submenu chooser widget - menus whose title starts with ?q=, a page at a time
+    # ?locale=<id> limits it to one locale, ?exclude=<id> leaves out the menu being edited
+    # the search text is matched case insensitively against the case folded search_title, as a range
+    # on the (locale, search_title) index - startswith keeps it exact whatever the database collation
+    # ordered by search_title on the same index, one extra row tells if there is a next page
+    menus = Menu.objects.all()
+    search = request.GET.get('q', '').strip().casefold()
+    if search:
+        menus = menus.filter(
+            search_title__gte=search, search_title__lt=search + '\U0010ffff', search_title__startswith=search
+        )
+    try:
+        if request.GET.get('locale'):
+            menus = menus.filter(locale_id=int(request.GET['locale']))
+        if request.GET.get('exclude'):
+            menus = menus.exclude(id=int(request.GET['exclude']))
+        page = max(int(request.GET.get('p', 1)), 1)
+    except ValueError:
+        raise Http404
+    start = (page - 1) * SUBMENU_CHOOSER_PAGE_SIZE
+    rows = list(menus.order_by('search_title', 'id').values_list('id', 'title')[start:start + SUBMENU_CHOOSER_PAGE_SIZE + 1])
+    return HttpResponse(json.dumps({
+        'results': [{'id': menu_id, 'title': title} for menu_id, title in rows[:SUBMENU_CHOOSER_PAGE_SIZE]],
+        'page': page,
+        'has_next': len(rows) > SUBMENU_CHOOSER_PAGE_SIZE,
+    }), content_type='application/json')
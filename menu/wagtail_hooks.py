@@ -0,0 +1,12 @@
+from django.urls import path
+from wagtail.core import hooks
+
+from .views import submenu_chooser
+
+
+@hooks.register('register_admin_urls')
+def register_submenu_chooser_url():
+    # admin urls are only served to users with admin access
+    return [
+        path('menu/submenu-chooser/', submenu_chooser, name='menu_submenu_chooser'),
+    ]
@@ -0,0 +1,42 @@
+from django import forms
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+
+
+class SubMenuChooser(forms.Widget):
+    """ SubMenuChooser Widget - searchable menu chooser for SubMenuItem.submenu
+        Renders the chosen menu id in a hidden input and its title in a search box. Typing in the box
+        fetches a page of matching menus from the submenu_chooser admin endpoint (menu.views), so only
+        the chosen menu is in the page however many menus there are.
+        Usage:
+        locale_id:  optional, only offer menus in this locale
+        exclude_id: optional, leave this menu out (the menu being edited)
+        title:      title of the chosen menu to show in the search box
+        """
+    class Media:
+        js = ['js/submenu_chooser.js']
+        css = {'all': ['css/submenu_chooser.css']}
+
+    def __init__(self, locale_id=None, exclude_id=None, title='', attrs=None):
+        self.locale_id = locale_id
+        self.exclude_id = exclude_id
+        self.title = title
+        super().__init__(attrs)
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        input_id = attrs.get('id', f'id_{name}')
+        return format_html(
+            '<div class="submenu-chooser" data-url="{}" data-locale="{}" data-exclude="{}" '
+            'data-more-label="{}" data-empty-label="{}">'
+            '<input type="hidden" name="{}" id="{}" value="{}">'
+            '<input type="text" class="submenu-chooser-search" id="{}-search" value="{}" '
+            'placeholder="{}" autocomplete="off">'
+            '<ul class="submenu-chooser-results"></ul>'
+            '</div>',
+            reverse('menu_submenu_chooser'), self.locale_id or '', self.exclude_id or '',
+            _("More..."), _("No menus found"),
+            name, input_id, '' if value is None else value,
+            input_id, self.title, _("Type to search menus"),
+        )
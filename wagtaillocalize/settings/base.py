@@ -46,6 +46,9 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'wagtail.contrib.redirects.middleware.RedirectMiddleware',
+    'menu.middleware.LocalizationMemoMiddleware',
+    # only active with MENU_TAG_TIMING = True - adds a Server-Timing header for the menu tags
+    'menu.middleware.MenuTagTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'wagtaillocalize.urls'
@@ -84,6 +87,32 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The menus, hreflang alternates and the per-process registries in menu are invalidated through
+# counters kept in the default cache, so it has to be shared by every worker process - the
+# default local memory cache is per process and changes made in one worker would never reach
+# the others (menu.checks warns about it). The database cache needs no extra service, create
+# its tables with "python manage.py createcachetable". Use redis or memcached where available.
+# A full database cache culls the entries whose keys sort first, the version counters among them,
+# so MAX_ENTRIES is kept well above what the menus (one entry per menu, locale, login state and
+# generation) can fill. The hreflang redirect maps are one entry per translation key, they have their
+# own cache (MENU_HREFLANG_CACHE) sized for the number of pages so they can't push anything else out.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'menu_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'hreflang': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'hreflang_cache',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+MENU_HREFLANG_CACHE = 'hreflang'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -8,10 +8,11 @@ from wagtail.core import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
 from search import views as search_views
-from menu.views import set_language_from_url
+from menu.views import set_language_from_url, sitemap
 
 urlpatterns = [
     path('lang/<str:language_code>/', set_language_from_url, name='set_language_from_url'),
+    path('sitemap.xml', sitemap, name='sitemap'),
     path('django-admin/', admin.site.urls),
     path('admin/', include(wagtailadmin_urls)),
     path('documents/', include(wagtaildocs_urls)),
@@ -28,6 +29,8 @@ if settings.DEBUG:
 # These paths are translatable so will be given a language prefix (eg, '/en', '/fr')
 urlpatterns = urlpatterns + i18n_patterns(
     path('search/', search_views.search, name='search'),
+    # menus as json in the language of the prefix, eg /fr/menus/1/
+    path('menus/', include('menu.urls')),
     # For anything not caught by a more specific rule above, hand over to
     # Wagtail's page serving mechanism. This should be the last pattern in
     # the list: